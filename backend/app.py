@@ -5,6 +5,10 @@ from routes.registration import registration_bp
 from routes.attendance import attendance_bp
 from routes.auth import auth_bp  # NEW
 from config import Config
+from utils.gallery_cache import gallery_cache
+from utils.model_registry import model_registry
+from utils.capture_sessions import capture_sessions
+from utils import cascades
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -19,6 +23,15 @@ app.register_blueprint(registration_bp)
 app.register_blueprint(attendance_bp)
 app.register_blueprint(auth_bp)  # NEW
 
+# Load models once and run a dummy frame so the first request is fast
+if Config.MODEL_WARMUP:
+    model_registry.warm_up()
+
+# Warm the face gallery cache from on-disk snapshots
+if Config.GALLERY_SNAPSHOT_PRELOAD:
+    from routes.attendance import db_manager
+    db_manager.preload_galleries()
+
 @app.route('/')
 def index():
     return {
@@ -29,7 +42,13 @@ def index():
 
 @app.route('/health')
 def health():
-    return {'status': 'healthy'}
+    return {
+        'status': 'healthy',
+        'gallery_cache': gallery_cache.stats(),
+        'models': model_registry.stats(),
+        'capture_sessions': capture_sessions.stats(),
+        'cascades': cascades.stats()
+    }
 
 if __name__ == '__main__':
     print("=" * 50)
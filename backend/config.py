@@ -7,17 +7,95 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
     DATABASE_NAME = 'attendance_system'
+    DB_INDEX_BOOTSTRAP = True  # Run schema migrations and ensure indexes at startup
+    DB_MIGRATION_LOCK_SECONDS = 600  # A migration claimed longer ago than this may be retried
+    DB_WRITE_CONCERN = 'majority'  # Acknowledgement required for registration writes
+    DB_WRITE_JOURNAL = True
+    REGISTRATION_BATCH_USERS = 100  # Users written per transaction when enrolling a cohort
     
     # Directories
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     FACES_DIR = os.path.join(BASE_DIR, '..', 'data', 'faces')
     ATTENDANCE_DIR = os.path.join(BASE_DIR, '..', 'data', 'attendance')
+    GALLERY_SNAPSHOT_DIR = os.path.join(BASE_DIR, '..', 'data', 'gallery')
+    MODELS_DIR = os.path.join(BASE_DIR, 'models')
+    
+    # Face Detector Model (bundled or locally configured, never downloaded)
+    FACE_DETECTOR_PROTOTXT = os.getenv(
+        'FACE_DETECTOR_PROTOTXT', os.path.join(MODELS_DIR, 'deploy.prototxt'))
+    FACE_DETECTOR_WEIGHTS = os.getenv(
+        'FACE_DETECTOR_WEIGHTS', os.path.join(MODELS_DIR, 'res10_300x300_ssd_iter_140000.caffemodel'))
+    FACE_DETECTOR_PROTOTXT_SHA256 = os.getenv(
+        'FACE_DETECTOR_PROTOTXT_SHA256', 'dcd661dc48fc9de0a341db1f666a2164ea63a67265c7f779bc12d6b3f2fa67e9')
+    FACE_DETECTOR_WEIGHTS_SHA256 = os.getenv(
+        'FACE_DETECTOR_WEIGHTS_SHA256', '2a56a11a57a4a295956b0660b4a3d76bbdca2206c4961cea8efe7d95c7cb2f2d')
+    # Fetched once at install time with `python fetch_models.py`, never at runtime
+    FACE_DETECTOR_WEIGHTS_URL = os.getenv(
+        'FACE_DETECTOR_WEIGHTS_URL',
+        'https://raw.githubusercontent.com/opencv/opencv_3rdparty/'
+        'dnn_samples_face_detector_20170830/res10_300x300_ssd_iter_140000.caffemodel')
+    FACE_DETECTOR_REQUIRED = os.getenv('FACE_DETECTOR_REQUIRED', 'false').lower() == 'true'  # Refuse to start on the Haar fallback
+    MODEL_WARMUP = True  # Push a dummy frame through the detector at startup
+    MODEL_WARMUP_DETECTORS = 1  # Pooled detectors to create and warm up front
     
     # Face Recognition Settings
     FACE_RECOGNITION_TOLERANCE = 0.6
     MIN_IMAGES_FOR_REGISTRATION = 10
     MAX_IMAGES_FOR_REGISTRATION = 30
+    ENCODING_STORAGE_FORMAT = 'float32'  # 'float32', 'float16' or 'int8'
+    FACE_DETECTOR_MAX_BATCH_SIZE = 16  # Frames per DNN forward pass
+    DETECTOR_POOL_SIZE = os.cpu_count() or 4  # Detectors per process for concurrent requests
+    DETECTOR_POOL_TIMEOUT_SECONDS = 30
+    
+    # Frame Decoding Settings
+    FRAME_DECODE_WORKERS = min(8, os.cpu_count() or 4)  # Shared threads for decoding uploaded frames
+    FRAME_WORKING_WIDTH = 640  # Liveness frames are decoded at 1/2 or 1/4 scale, never narrower than this
+    
+    # Attendance Settings
+    LATE_ARRIVAL_TIME = '09:31:00'  # Marks at or after this time count as late
+    EXPORT_BATCH_SIZE = 1000  # Attendance records fetched per cursor batch when exporting
+    
+    # Group Attendance Settings
+    GROUP_MAX_PHOTOS = 5
+    GROUP_MIN_FACE_CONFIDENCE = 0.5
+    GROUP_TILE_SIZE = 600  # Photos larger than this are also scanned in overlapping tiles
+    GROUP_TILE_OVERLAP = 0.25
+    GROUP_NMS_THRESHOLD = 0.3  # IoU above which detections from neighbouring tiles are merged
+    NOTIFICATION_WORKERS = 2  # Shared background threads sending attendance emails
+    
+    # Lecture Video Attendance Settings
+    VIDEO_SAMPLE_FPS = 1.0  # Video frames analyzed per second of footage
+    VIDEO_BATCH_SIZE = 8  # Sampled frames per worker task
+    VIDEO_MIN_SIGHTINGS = 3  # Sampled frames a student must be recognized in
+    
+    # Blink Liveness Settings
+    BLINK_MIN_FRAMES = 5
+    BLINK_MIN_EYE_PRESENCE = 0.6  # Fraction of frames that must show two eyes
+    BLINK_MIN_EAR_DROP = 0.05  # Mean-to-min eye aspect ratio drop that counts as a blink
+    FACE_TRACK_MIN_SCORE = 0.6  # Template match score below which the face is re-detected
+
+    # Streaming Capture Session Settings
+    CAPTURE_SESSION_FRAMES = 15  # Frames a kiosk sends when it does not say otherwise
+    CAPTURE_SESSION_MAX_FRAMES = 30
+    CAPTURE_SESSION_TTL_SECONDS = 60  # Idle sessions are dropped after this
+    CAPTURE_SESSION_MAX_ACTIVE = 256
+    
+    # Gallery Cache Settings
+    GALLERY_CACHE_MAX_CLASSES = 64
+    GALLERY_CACHE_TTL_SECONDS = 300  # Bounds staleness across worker processes
+    GALLERY_SNAPSHOTS_ENABLED = True  # Persist class galleries as memory-mapped .npy files
+    GALLERY_SNAPSHOT_PRELOAD = True  # Load every snapshot into the cache at startup
+    GALLERY_SNAPSHOT_MAX_GAP = 16  # Generations to wait for an out-of-order change before skipping it
+    
+    # Campus-wide Face Index Settings
+    FACE_INDEX_TYPE = 'ivf'  # 'ivf' (approximate) or 'exact' (brute force)
+    FACE_INDEX_NLIST = 64  # Number of IVF clusters
+    FACE_INDEX_NPROBE = 8  # Clusters scanned per search; higher = better recall, slower
+    FACE_INDEX_MIN_TRAIN_SIZE = 2048  # Below this many encodings search stays exact
+    FACE_INDEX_KMEANS_ITERATIONS = 10
+    FACE_SEARCH_MAX_RESULTS = 50  # Upper bound for the search-face top_k parameter
     
     # Create directories if they don't exist
     os.makedirs(FACES_DIR, exist_ok=True)
     os.makedirs(ATTENDANCE_DIR, exist_ok=True)
+    os.makedirs(GALLERY_SNAPSHOT_DIR, exist_ok=True)
@@ -0,0 +1,63 @@
+"""
+Install the face detector weights into backend/models
+
+Usage (from the backend directory, once per install):
+    python fetch_models.py
+    python fetch_models.py --url https://mirror.example/res10_300x300_ssd_iter_140000.caffemodel
+
+The server never downloads models at runtime. This script fetches the
+res10 SSD weights from FACE_DETECTOR_WEIGHTS_URL (or --url), checks them
+against FACE_DETECTOR_WEIGHTS_SHA256 and only then moves them to
+FACE_DETECTOR_WEIGHTS. Air-gapped installs can copy the file there by hand;
+it is verified the same way when the server starts.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import urllib.request
+
+from config import Config
+from utils.model_registry import file_sha256, verify_model_file
+
+
+def fetch_weights(url, destination, expected_sha256):
+    """Download to a temporary file and move it into place once verified"""
+    if verify_model_file(destination, expected_sha256):
+        print(f"✓ {destination} already present and verified")
+        return True
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.part')
+    os.close(fd)
+    try:
+        print(f"⬇️ Downloading {url}")
+        try:
+            urllib.request.urlretrieve(url, temp_path)
+        except OSError as e:
+            print(f"❌ Download failed: {e}")
+            return False
+
+        actual = file_sha256(temp_path)
+        if expected_sha256 and actual.lower() != expected_sha256.lower():
+            print(f"❌ Checksum mismatch: expected {expected_sha256}, got {actual}")
+            return False
+
+        os.replace(temp_path, destination)
+        print(f"✓ Installed {destination} (sha256 {actual})")
+        return True
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Install the face detector weights')
+    parser.add_argument('--url', default=Config.FACE_DETECTOR_WEIGHTS_URL)
+    args = parser.parse_args()
+
+    ok = (
+        verify_model_file(Config.FACE_DETECTOR_PROTOTXT, Config.FACE_DETECTOR_PROTOTXT_SHA256) and
+        fetch_weights(args.url, Config.FACE_DETECTOR_WEIGHTS, Config.FACE_DETECTOR_WEIGHTS_SHA256)
+    )
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,62 @@
+"""
+Inspect and maintain the MongoDB schema
+
+Usage (from the backend directory):
+    python manage_indexes.py report
+    python manage_indexes.py migrate
+    python manage_indexes.py dedupe-attendance            # show what would be removed
+    python manage_indexes.py dedupe-attendance --apply    # back up and remove, then migrate
+    python manage_indexes.py rebuild-rollup --date 2024-03-04
+
+The server applies pending migrations at startup, but never deletes data
+on its own. Steps that do are run here, explicitly.
+"""
+import argparse
+
+from pymongo import MongoClient
+import certifi
+
+from config import Config
+from utils.index_manager import IndexManager, rebuild_daily_rollup, remove_duplicate_attendance
+
+
+def connect():
+    client = MongoClient(Config.MONGODB_URI, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+    return client[Config.DATABASE_NAME]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect and maintain the MongoDB schema')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('report', help='list missing, undeclared and unused indexes')
+    commands.add_parser('migrate', help='apply pending migrations and ensure indexes')
+    dedupe = commands.add_parser('dedupe-attendance',
+                                 help='find attendance recorded twice for a student, class and day')
+    dedupe.add_argument('--apply', action='store_true',
+                        help='back up and remove the later duplicates, then migrate')
+    rebuild = commands.add_parser('rebuild-rollup',
+                                  help='recount the attendance_daily stats from the attendance records')
+    rebuild.add_argument('--date', default=None, help='YYYY-MM-DD to recount (defaults to every date)')
+    args = parser.parse_args()
+
+    db = connect()
+    manager = IndexManager(db)
+
+    if args.command == 'report':
+        for collection, entry in manager.report().items():
+            print(f"{collection}: missing {entry['missing'] or '-'}, "
+                  f"undeclared {entry['undeclared'] or '-'}, unused {entry['unused'] or '-'}")
+
+    elif args.command == 'migrate':
+        manager.bootstrap()
+
+    elif args.command == 'dedupe-attendance':
+        extra = remove_duplicate_attendance(db, apply=args.apply)
+        if not args.apply:
+            print(f"{extra} duplicate record(s) found; rerun with --apply to back them up and remove them")
+        else:
+            manager.bootstrap()
+
+    elif args.command == 'rebuild-rollup':
+        written = rebuild_daily_rollup(db, args.date)
+        print(f"✓ Rebuilt {written} daily rollup document(s)" + (f" for {args.date}" if args.date else ""))
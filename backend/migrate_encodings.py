@@ -0,0 +1,83 @@
+"""
+Convert face_encodings documents to the compact binary format
+
+Usage (from the backend directory):
+    python migrate_encodings.py                  # use Config.ENCODING_STORAGE_FORMAT
+    python migrate_encodings.py --format float16
+    python migrate_encodings.py --dry-run
+
+Legacy documents (encoding stored as a list of doubles) and documents in a
+different binary format are rewritten in place. Re-running is safe.
+"""
+import argparse
+
+from bson import BSON
+from pymongo import UpdateOne
+from config import Config
+from utils.db_manager import DatabaseManager
+from utils.encoding_codec import (
+    encode_encoding, decode_encoding, ENCODING_DTYPES, ENCODING_FORMAT_VERSION
+)
+
+
+def migrate(storage_format, batch_size=500, dry_run=False):
+    db_manager = DatabaseManager()
+    collection = db_manager.face_encodings
+
+    query = {'$or': [
+        {'encoding_format': {'$ne': storage_format}},
+        {'encoding_version': {'$ne': ENCODING_FORMAT_VERSION}}
+    ]}
+    total = collection.count_documents(query)
+    print(f"Found {total} face encodings to convert to {storage_format}")
+
+    converted = 0
+    bytes_before = 0
+    bytes_after = 0
+    operations = []
+
+    cursor = collection.find(query, batch_size=batch_size)
+    for doc in cursor:
+        fields = encode_encoding(decode_encoding(doc), storage_format)
+        unset = {} if storage_format == 'int8' else {'encoding_scale': ''}
+
+        bytes_before += len(BSON.encode({'encoding': doc['encoding']}))
+        bytes_after += len(BSON.encode({'encoding': fields['encoding']}))
+
+        update = {'$set': fields}
+        if unset:
+            update['$unset'] = unset
+        operations.append(UpdateOne({'_id': doc['_id']}, update))
+
+        if len(operations) >= batch_size:
+            converted += _flush(collection, operations, dry_run)
+            operations = []
+            print(f"  {converted}/{total} converted")
+
+    if operations:
+        converted += _flush(collection, operations, dry_run)
+
+    ratio = (bytes_before / bytes_after) if bytes_after else 0
+    print(f"✓ {'Would convert' if dry_run else 'Converted'} {converted} encodings")
+    print(f"  Encoding payload: {bytes_before} -> {bytes_after} bytes ({ratio:.1f}x smaller)")
+    return converted
+
+
+def _flush(collection, operations, dry_run):
+    if dry_run:
+        return len(operations)
+    result = collection.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert stored face encodings to binary format')
+    parser.add_argument('--format', choices=sorted(ENCODING_DTYPES),
+                        default=Config.ENCODING_STORAGE_FORMAT,
+                        help='target storage format')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report what would change without writing')
+    args = parser.parse_args()
+
+    migrate(args.format, batch_size=args.batch_size, dry_run=args.dry_run)
@@ -1,13 +1,17 @@
 from flask import Blueprint, request, jsonify, Response
-import cv2
-import base64
-import numpy as np
-from datetime import datetime, timedelta
-from utils.face_utils import FaceUtils
+from datetime import datetime
+from contextlib import closing
+import csv
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from utils.model_registry import get_face_utils
+from utils.face_matcher import FaceMatcher
 from utils.db_manager import DatabaseManager
-import pandas as pd
 from utils.email_notifications import EmailNotifications
-from utils.blink_detector import check_blink_liveness
+from utils.blink_detector import check_blink_liveness, BlinkLivenessEvaluator
+from utils.capture_sessions import capture_sessions
+from utils.frame_decoder import request_fields, request_frames, decode_frame, decode_frames, iter_frames
+from config import Config
 import os
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 
@@ -15,10 +19,175 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 attendance_bp = Blueprint('attendance', __name__)
 
 # Initialize utilities
-face_utils = FaceUtils()
+face_utils = get_face_utils()
+face_matcher = FaceMatcher()
 db_manager = DatabaseManager()
 email_notifier = EmailNotifications()
 
+# Group marks email in the background, on a bounded shared pool
+_notification_pool = ThreadPoolExecutor(
+    max_workers=Config.NOTIFICATION_WORKERS,
+    thread_name_prefix='attendance-email'
+)
+
+
+def _liveness_failed_response(confidence, reason):
+    """Payload and status code for a failed blink check"""
+    print(f"❌ BLINK CHECK FAILED: {reason}")
+    return {
+        'status': 'liveness_failed',
+        'message': f'❌ {reason}',
+        'confidence': round(confidence, 2),
+        'tips': [
+            'Look directly at the camera',
+            'Blink naturally and clearly',
+            'Ensure good lighting on your face',
+            'Do not use photos or videos'
+        ]
+    }, 403
+
+
+def _send_mark_notifications(user, time_str):
+    """Email the student and, for late arrivals, the admin; returns is_late"""
+    is_late = False
+    try:
+        # Send confirmation email to user
+        user_email = user.get('email', '')
+        if user_email:
+            email_notifier.send_attendance_notification(
+                user_email,
+                user['name'],
+                time_str
+            )
+            print(f"✓ Email sent to {user_email}")
+        
+        # Check if late arrival (at or after LATE_ARRIVAL_TIME)
+        is_late = time_str >= Config.LATE_ARRIVAL_TIME
+        
+        if is_late:
+            admin_email = os.getenv('ADMIN_EMAIL')
+            if admin_email:
+                email_notifier.send_late_arrival_alert(
+                    admin_email,
+                    user['name'],
+                    time_str
+                )
+                print(f"⚠️ Late arrival alert sent to admin")
+                
+    except Exception as email_error:
+        print(f"❌ Email notification failed: {email_error}")
+        # Continue even if email fails
+    return is_late
+
+
+def _send_group_notifications(marked):
+    """Send notifications for (user, time) pairs marked by a group photo"""
+    for user, time_str in marked:
+        _send_mark_notifications(user, time_str)
+
+
+def _recognize_and_mark(img, class_code):
+    """
+    Recognize the face in img against class_code and mark attendance
+    Returns the response payload and status code.
+    """
+    # ===== STEP 2: FACE DETECTION & ENCODING =====
+    print("🔍 Detecting face and generating encoding...")
+    analysis = face_utils.analyze(img)
+    face_encoding = analysis.encoding
+    
+    if face_encoding is None:
+        return {
+            'status': 'error',
+            'message': 'No face detected. Please ensure your face is clearly visible.'
+        }, 400
+    
+    print("✓ Face encoding generated")
+    
+    # ===== STEP 3: GET USERS FROM THIS CLASS ONLY =====
+    gallery = db_manager.get_class_gallery(class_code)
+    users = gallery.users
+    print(f"✓ Retrieved {len(users)} users from class {class_code}")
+    
+    if len(users) == 0:
+        return {
+            'status': 'error',
+            'message': f'No registered users found in class {class_code}'
+        }, 404
+    
+    # ===== STEP 4: FACE MATCHING =====
+    print("🔎 Matching face with registered users...")
+    match = face_matcher.match(gallery, face_encoding, top_k=3)
+    
+    for candidate in match.candidates:
+        print(f"  Candidate {candidate['user_id']}: max {candidate['max_similarity']:.3f}, "
+              f"mean {candidate['mean_similarity']:.3f}")
+    
+    if not match.matched:
+        print("❌ Face not recognized")
+        return {
+            'status': 'not_recognized',
+            'message': f'Face not recognized in class {class_code}. Please register first.'
+        }, 404
+    
+    best_match = match.user
+    best_distance = match.distance
+    
+    # Double-check class assignment
+    if best_match.get('class_code') != class_code:
+        print(f"❌ User belongs to different class: {best_match.get('class_code')}")
+        return {
+            'status': 'wrong_class',
+            'message': 'Student is not registered in this class'
+        }, 403
+    
+    print(f"✓ Face matched: {best_match['name']} ({best_match['user_id']})")
+    print(f"  Confidence: {(1 - best_distance) * 100:.2f}%")
+    
+    # ===== STEP 5: MARK ATTENDANCE =====
+    result = db_manager.mark_attendance(
+        best_match['user_id'], 
+        best_match['name'],
+        class_code=class_code
+    )
+    
+    # Handle already marked case
+    if result['status'] == 'already_marked':
+        print(f"ℹ️ Attendance already marked at {result['time']}")
+        return {
+            'status': 'already_marked',
+            'message': f"Attendance already marked today at {result['time']}",
+            'name': best_match['name'],
+            'user_id': best_match['user_id'],
+            'time': result['time'],
+            'email': best_match.get('email', ''),
+            'department': best_match.get('department', 'N/A'),
+            'class_code': class_code
+        }, 200
+    
+    # ===== STEP 6: SEND EMAIL NOTIFICATIONS =====
+    is_late = False
+    if result['status'] == 'success':
+        is_late = _send_mark_notifications(best_match, result['time'])
+    
+    # ===== STEP 7: RETURN SUCCESS RESPONSE =====
+    print(f"✅ Attendance marked successfully for {best_match['name']}")
+    print(f"{'='*60}\n")
+    
+    return {
+        'status': 'success',
+        'message': f"✅ Attendance marked for {best_match['name']}!",
+        'name': best_match['name'],
+        'user_id': best_match['user_id'],
+        'email': best_match.get('email', ''),
+        'department': best_match.get('department', 'N/A'),
+        'class_code': class_code,
+        'time': result['time'],
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'confidence': round((1 - best_distance) * 100, 2),
+        'is_late': is_late
+    }, 200
+
 
 @attendance_bp.route('/api/mark-attendance', methods=['POST'])
 @jwt_required()
@@ -39,221 +208,348 @@ def mark_attendance():
         print(f"ATTENDANCE REQUEST FROM CLASS: {class_code}")
         print(f"{'='*60}")
         
-        data = request.get_json()
+        data = request_fields(request)
         mode = data.get('mode', 'single')
         
         # ===== BLINK DETECTION MODE =====
         if mode == 'blink_detection':
-            images_data = data.get('images', [])
+            images_data = request_frames(request)
             
-            if len(images_data) < 5:
+            if len(images_data) < Config.BLINK_MIN_FRAMES:
                 return jsonify({
                     'status': 'error',
-                    'message': 'Need at least 5 frames for blink detection'
+                    'message': f'Need at least {Config.BLINK_MIN_FRAMES} frames for blink detection'
                 }), 400
             
             print(f"📸 Processing {len(images_data)} frames for blink detection...")
+            print("👁️ Checking for blink pattern...")
             
-            # Decode all images
-            frames = []
-            for idx, img_data in enumerate(images_data):
-                try:
-                    img_bytes = base64.b64decode(img_data.split(',')[1])
-                    nparr = np.frombuffer(img_bytes, np.uint8)
-                    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    frames.append(img)
-                except Exception as e:
-                    print(f"  Frame {idx+1}: Decode error - {e}")
-                    continue
+            # Decode in parallel at working resolution and analyze frame by
+            # frame; stop once the verdict is in
+            evaluator = BlinkLivenessEvaluator(expected_frames=len(images_data))
+            frame_indices = []
+            with closing(iter_frames(images_data, Config.FRAME_WORKING_WIDTH, with_scale=True)) as decoded:
+                for idx, (img, scale) in enumerate(decoded):
+                    if img is None:
+                        print(f"  Frame {idx+1}: Decode error")
+                        continue
+                    
+                    frame_indices.append(idx)
+                    if evaluator.feed(img, scale) != BlinkLivenessEvaluator.PENDING:
+                        break
             
-            if len(frames) < 5:
+            if evaluator.state == BlinkLivenessEvaluator.PENDING and len(frame_indices) < Config.BLINK_MIN_FRAMES:
                 return jsonify({
                     'status': 'error',
                     'message': 'Failed to decode enough frames'
                 }), 400
             
             # Check blink liveness
-            print("👁️ Checking for blink pattern...")
-            is_live, confidence, reason = check_blink_liveness(frames)
+            is_live, confidence, reason = evaluator.finish()
+            print(f"  Analyzed {evaluator.frames_seen}/{len(images_data)} frames")
             
             if not is_live:
-                print(f"❌ BLINK CHECK FAILED: {reason}")
-                return jsonify({
-                    'status': 'liveness_failed',
-                    'message': f'❌ {reason}',
-                    'confidence': round(confidence, 2),
-                    'tips': [
-                        'Look directly at the camera',
-                        'Blink naturally and clearly',
-                        'Ensure good lighting on your face',
-                        'Do not use photos or videos'
-                    ]
-                }), 403
+                payload, status_code = _liveness_failed_response(confidence, reason)
+                return jsonify(payload), status_code
             
             print(f"✅ Blink detected! Confidence: {confidence:.1f}%")
             
-            # Use the clearest frame (middle frames usually best)
-            img = frames[len(frames) // 2]
+            # Re-decode the eyes-open frame nearest the middle at full
+            # resolution for encoding
+            img = decode_frame(images_data[frame_indices[evaluator.best_frame_index()]])
             
         # ===== SINGLE IMAGE MODE (Legacy) =====
         else:
-            image_data = data.get('image')
+            images_data = request_frames(request, field='image', single_field='image')
             
-            if not image_data:
+            if not images_data:
                 return jsonify({
                     'status': 'error',
                     'error': 'No image provided'
                 }), 400
             
-            try:
-                img_bytes = base64.b64decode(image_data.split(',')[1])
-                nparr = np.frombuffer(img_bytes, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            except Exception as e:
+            img = decode_frame(images_data[0])
+            if img is None:
                 return jsonify({
                     'status': 'error',
                     'error': 'Invalid image format'
                 }), 400
         
-        # ===== STEP 2: FACE DETECTION & ENCODING =====
-        print("🔍 Detecting face and generating encoding...")
-        face_encoding = face_utils.generate_encoding(img)
+        payload, status_code = _recognize_and_mark(img, class_code)
+        return jsonify(payload), status_code
         
-        if face_encoding is None:
-            return jsonify({
-                'status': 'error',
-                'message': 'No face detected. Please ensure your face is clearly visible.'
-            }), 400
+    except Exception as e:
+        print(f"❌ Error in mark_attendance: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'status': 'error',
+            'error': 'Internal server error',
+            'details': str(e)
+        }), 500
+
+
+@attendance_bp.route('/api/attendance/sessions', methods=['POST'])
+@jwt_required()
+def create_capture_session():
+    """
+    Open a streaming capture session for blink-verified attendance
+    The kiosk then posts frames to /api/attendance/sessions/<id>/frames as
+    they are captured instead of uploading the whole burst at the end.
+    """
+    try:
+        class_code = get_jwt_identity()
+        claims = get_jwt()
+        data = request.get_json(silent=True) or {}
         
-        print("✓ Face encoding generated")
+        expected_frames = data.get('expected_frames')
+        if expected_frames is not None:
+            try:
+                expected_frames = int(expected_frames)
+            except (TypeError, ValueError):
+                return jsonify({
+                    'status': 'error',
+                    'message': 'expected_frames must be an integer'
+                }), 400
         
-        # ===== STEP 3: GET USERS FROM THIS CLASS ONLY =====
-        users = db_manager.get_all_users(class_code=class_code)
-        print(f"✓ Retrieved {len(users)} users from class {class_code}")
+        session = capture_sessions.create(
+            class_code,
+            claims.get('class_name', 'Unknown'),
+            expected_frames=expected_frames
+        )
+        print(f"📡 Capture session {session.session_id} opened for {class_code} "
+              f"({session.expected_frames} frames)")
         
-        if len(users) == 0:
+        return jsonify({
+            'status': 'success',
+            'session_id': session.session_id,
+            'expected_frames': session.expected_frames,
+            'ttl_seconds': capture_sessions.ttl_seconds
+        }), 201
+        
+    except Exception as e:
+        print(f"❌ Error creating capture session: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'error': str(e)
+        }), 500
+
+
+@attendance_bp.route('/api/attendance/sessions/<session_id>/frames', methods=['POST'])
+@jwt_required()
+def add_capture_frames(session_id):
+    """
+    Feed frames into a capture session
+    Accepts {"image": ...} or {"images": [...]}. Responds with status
+    'pending' until liveness is decided, then with the same payload as
+    /api/mark-attendance. Frames sent after that get the final answer again.
+    """
+    try:
+        class_code = get_jwt_identity()
+        session = capture_sessions.get(session_id, class_code)
+        
+        if session is None:
             return jsonify({
                 'status': 'error',
-                'message': f'No registered users found in class {class_code}'
+                'message': 'Capture session not found or expired'
             }), 404
         
-        # ===== STEP 4: FACE MATCHING =====
-        print("🔎 Matching face with registered users...")
-        best_match = None
-        best_distance = float('inf')
+        images_data = request_frames(request)
+        
+        if not images_data:
+            return jsonify({
+                'status': 'error',
+                'message': 'No frames provided'
+            }), 400
         
-        for user in users:
-            # Verify user belongs to this class
-            if user.get('class_code') != class_code:
-                continue
+        with session.lock:
+            if session.complete:
+                payload, status_code = session.response
+                return jsonify(payload), status_code
             
-            encodings = user.get('face_encodings', [])
-            if not encodings:
-                continue
+            evaluator = session.evaluator
+            remaining = max(0, session.expected_frames - session.frames_received)
+            images_data = images_data[:remaining]
             
-            match_index, distance = face_utils.compare_faces(
-                encodings, 
-                face_encoding
-            )
+            with closing(iter_frames(images_data, Config.FRAME_WORKING_WIDTH, with_scale=True)) as decoded:
+                for img_data, (img, scale) in zip(images_data, decoded):
+                    if img is None:
+                        print(f"  Frame {session.frames_received+1}: Decode error")
+                    if session.add_frame(img, img_data, scale) != BlinkLivenessEvaluator.PENDING:
+                        break
+            
+            if evaluator.state == BlinkLivenessEvaluator.PENDING and not session.exhausted:
+                return jsonify({
+                    'status': 'pending',
+                    'session_id': session.session_id,
+                    'frames_received': session.frames_received,
+                    'frames_analyzed': evaluator.frames_seen,
+                    'expected_frames': session.expected_frames
+                }), 202
+            
+            print(f"\n{'='*60}")
+            print(f"STREAMED ATTENDANCE FROM CLASS: {class_code}")
+            print(f"{'='*60}")
+            print(f"  Analyzed {evaluator.frames_seen}/{session.expected_frames} frames")
+            
+            if evaluator.frames_seen < Config.BLINK_MIN_FRAMES and evaluator.state == BlinkLivenessEvaluator.PENDING:
+                response = ({
+                    'status': 'error',
+                    'message': 'Failed to decode enough frames'
+                }, 400)
+            else:
+                is_live, confidence, reason = evaluator.finish()
+                if not is_live:
+                    response = _liveness_failed_response(confidence, reason)
+                else:
+                    print(f"✅ Blink detected! Confidence: {confidence:.1f}%")
+                    response = _recognize_and_mark(decode_frame(session.best_payload()), class_code)
             
-            if match_index is not None and distance < best_distance:
-                best_distance = distance
-                best_match = user
+            session.finish(response)
+            payload, status_code = response
+            return jsonify(payload), status_code
         
-        if best_match is None:
-            print("❌ Face not recognized")
+    except Exception as e:
+        print(f"❌ Error in capture session: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'status': 'error',
+            'error': 'Internal server error',
+            'details': str(e)
+        }), 500
+
+
+@attendance_bp.route('/api/attendance/sessions/<session_id>', methods=['DELETE'])
+@jwt_required()
+def close_capture_session(session_id):
+    """Abandon a capture session"""
+    class_code = get_jwt_identity()
+    if capture_sessions.get(session_id, class_code) is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Capture session not found or expired'
+        }), 404
+    
+    capture_sessions.discard(session_id)
+    return jsonify({'status': 'success', 'closed': True}), 200
+
+
+@attendance_bp.route('/api/attendance/group', methods=['POST'])
+@jwt_required()
+def mark_group_attendance():
+    """
+    Mark attendance for everyone visible in one or a few classroom photos
+    Every detected face is matched against the class gallery in one matrix
+    operation with one-to-one assignment, and all marks are written with a
+    single bulk database operation.
+    """
+    try:
+        class_code = get_jwt_identity()
+        
+        print(f"\n{'='*60}")
+        print(f"GROUP ATTENDANCE REQUEST FROM CLASS: {class_code}")
+        print(f"{'='*60}")
+        
+        images_data = request_frames(request)
+        if not images_data:
             return jsonify({
-                'status': 'not_recognized',
-                'message': f'Face not recognized in class {class_code}. Please register first.'
-            }), 404
+                'status': 'error',
+                'message': 'No images provided'
+            }), 400
+        
+        if len(images_data) > Config.GROUP_MAX_PHOTOS:
+            return jsonify({
+                'status': 'error',
+                'message': f'At most {Config.GROUP_MAX_PHOTOS} photos per request'
+            }), 400
+        
+        photos = [img for img in decode_frames(images_data) if img is not None]
+        if not photos:
+            return jsonify({
+                'status': 'error',
+                'error': 'Invalid image format'
+            }), 400
         
-        # Double-check class assignment
-        if best_match.get('class_code') != class_code:
-            print(f"❌ User belongs to different class: {best_match.get('class_code')}")
+        # ===== DETECT & ENCODE EVERY FACE =====
+        print(f"🔍 Detecting faces in {len(photos)} photo(s)...")
+        faces = face_utils.analyze_group(photos)
+        print(f"✓ Detected {len(faces)} faces")
+        
+        if not faces:
             return jsonify({
-                'status': 'wrong_class',
-                'message': 'Student is not registered in this class'
-            }), 403
+                'status': 'error',
+                'message': 'No faces detected. Please use a clearer, well-lit photo.'
+            }), 400
         
-        print(f"✓ Face matched: {best_match['name']} ({best_match['user_id']})")
-        print(f"  Confidence: {(1 - best_distance) * 100:.2f}%")
+        gallery = db_manager.get_class_gallery(class_code)
+        if len(gallery.users) == 0:
+            return jsonify({
+                'status': 'error',
+                'message': f'No registered users found in class {class_code}'
+            }), 404
         
-        # ===== STEP 5: MARK ATTENDANCE =====
-        result = db_manager.mark_attendance(
-            best_match['user_id'], 
-            best_match['name'],
+        # ===== MATCH ALL FACES AT ONCE =====
+        print("🔎 Matching faces with registered users...")
+        matches = face_matcher.match_many(gallery, [face.encoding for face in faces])
+        recognized = [
+            (face, match) for face, match in zip(faces, matches)
+            if match.matched and match.user.get('class_code') == class_code
+        ]
+        print(f"✓ Recognized {len(recognized)} of {len(faces)} faces")
+        
+        # ===== MARK ATTENDANCE IN BULK =====
+        marks = db_manager.mark_attendance_bulk(
+            [(match.user['user_id'], match.user['name']) for _, match in recognized],
             class_code=class_code
         )
         
-        # Handle already marked case
-        if result['status'] == 'already_marked':
-            print(f"ℹ️ Attendance already marked at {result['time']}")
-            return jsonify({
-                'status': 'already_marked',
-                'message': f"Attendance already marked today at {result['time']}",
-                'name': best_match['name'],
-                'user_id': best_match['user_id'],
-                'time': result['time'],
-                'email': best_match.get('email', ''),
-                'department': best_match.get('department', 'N/A'),
-                'class_code': class_code
-            }), 200
+        students = []
+        newly_marked = []
+        for face, match in recognized:
+            user = match.user
+            mark = marks.get(user['user_id'], {'status': 'error'})
+            students.append({
+                'name': user['name'],
+                'user_id': user['user_id'],
+                'department': user.get('department', 'N/A'),
+                'status': mark['status'],
+                'time': mark.get('time'),
+                'confidence': round(match.similarity * 100, 2),
+                'photo': face.image_index,
+                'box': [int(v) for v in face.box]
+            })
+            if mark['status'] == 'success':
+                newly_marked.append((user, mark['time']))
         
-        # ===== STEP 6: SEND EMAIL NOTIFICATIONS =====
-        is_late = False
-        if result['status'] == 'success':
-            try:
-                # Send confirmation email to user
-                user_email = best_match.get('email', '')
-                if user_email:
-                    email_notifier.send_attendance_notification(
-                        user_email,
-                        best_match['name'],
-                        result['time']
-                    )
-                    print(f"✓ Email sent to {user_email}")
-                
-                # Check if late arrival (after 9:30 AM)
-                time_parts = result['time'].split(':')
-                hours = int(time_parts[0])
-                minutes = int(time_parts[1])
-                
-                is_late = hours > 9 or (hours == 9 and minutes > 30)
-                
-                if is_late:
-                    admin_email = os.getenv('ADMIN_EMAIL')
-                    if admin_email:
-                        email_notifier.send_late_arrival_alert(
-                            admin_email,
-                            best_match['name'],
-                            result['time']
-                        )
-                        print(f"⚠️ Late arrival alert sent to admin")
-                        
-            except Exception as email_error:
-                print(f"❌ Email notification failed: {email_error}")
-                # Continue even if email fails
-        
-        # ===== STEP 7: RETURN SUCCESS RESPONSE =====
-        print(f"✅ Attendance marked successfully for {best_match['name']}")
+        unrecognized = [
+            {'photo': face.image_index, 'box': [int(v) for v in face.box]}
+            for face, match in zip(faces, matches) if not match.matched
+        ]
+        
+        # Emails go out in the background so the response is not held up
+        if newly_marked:
+            _notification_pool.submit(_send_group_notifications, newly_marked)
+        
+        already = sum(1 for s in students if s['status'] == 'already_marked')
+        print(f"✅ Group attendance: {len(newly_marked)} marked, {already} already marked")
         print(f"{'='*60}\n")
         
         return jsonify({
             'status': 'success',
-            'message': f"✅ Attendance marked for {best_match['name']}!",
-            'name': best_match['name'],
-            'user_id': best_match['user_id'],
-            'email': best_match.get('email', ''),
-            'department': best_match.get('department', 'N/A'),
+            'message': f"✅ Attendance marked for {len(newly_marked)} student(s)",
             'class_code': class_code,
-            'time': result['time'],
             'date': datetime.now().strftime('%Y-%m-%d'),
-            'confidence': round((1 - best_distance) * 100, 2),
-            'is_late': is_late
+            'faces_detected': len(faces),
+            'marked': len(newly_marked),
+            'already_marked': already,
+            'registered': len(gallery.users),
+            'students': students,
+            'unrecognized': unrecognized
         }), 200
         
     except Exception as e:
-        print(f"❌ Error in mark_attendance: {str(e)}")
+        print(f"❌ Error in group attendance: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({
@@ -332,27 +628,16 @@ def get_attendance_stats():
         
         today = datetime.now().strftime('%Y-%m-%d')
         
-        if role == 'admin':
-            today_records = db_manager.get_attendance_by_date(today)
-            all_users = db_manager.get_all_users()
-        else:
-            today_records = db_manager.get_attendance_by_date(today, class_code=class_code)
-            all_users = db_manager.get_all_users(class_code=class_code)
+        # Counts come from count_documents and the daily rollup, not records
+        scope = None if role == 'admin' else class_code
+        total_users = db_manager.count_users(scope)
+        daily = db_manager.get_daily_stats(today, scope)
         
-        total_users = len(all_users)
-        present_today = len(today_records)
+        present_today = daily['present']
+        late_count = daily['late']
         absent_today = total_users - present_today
         attendance_rate = (present_today / total_users * 100) if total_users > 0 else 0
         
-        # Count late arrivals
-        late_count = 0
-        for record in today_records:
-            time_parts = record['time'].split(':')
-            hours = int(time_parts[0])
-            minutes = int(time_parts[1])
-            if hours > 9 or (hours == 9 and minutes > 30):
-                late_count += 1
-        
         return jsonify({
             'status': 'success',
             'stats': {
@@ -375,10 +660,59 @@ def get_attendance_stats():
         }), 500
 
 
+class _CSVLine:
+    """File-like target that hands back what csv.writer writes"""
+    def write(self, value):
+        return value
+
+
+def _export_rows(first, records):
+    """
+    CSV lines for an attendance cursor whose first record was already read
+    Day and Status are derived as rows stream past; weekday names are
+    computed once per date. The cursor is closed when streaming ends.
+    Headers are already sent by then, so a failure mid-stream is logged and
+    reported as a final ERROR row rather than a silently truncated file.
+    """
+    writer = csv.writer(_CSVLine())
+    weekdays = {}
+    yield writer.writerow(['User ID', 'Name', 'Class', 'Date', 'Time', 'Day', 'Status'])
+    
+    try:
+        for r in itertools.chain([first], records):
+            date = r.get('date', 'N/A')
+            time_str = r.get('time', 'N/A')
+            
+            day = weekdays.get(date)
+            if day is None:
+                try:
+                    day = datetime.strptime(date, '%Y-%m-%d').strftime('%A')
+                except (TypeError, ValueError):
+                    day = 'N/A'
+                weekdays[date] = day
+            
+            yield writer.writerow([
+                r.get('user_id', 'N/A'),
+                r.get('name', 'Unknown'),
+                r.get('class_code', 'N/A'),
+                date,
+                time_str,
+                day,
+                'Late' if time_str != 'N/A' and time_str >= Config.LATE_ARRIVAL_TIME else 'On Time'
+            ])
+    except Exception as e:
+        print(f"❌ Error streaming attendance export: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        yield writer.writerow(['ERROR', f'Export incomplete: {e}'])
+    finally:
+        records.close()
+
+
 @attendance_bp.route('/api/attendance/export', methods=['GET'])
 @jwt_required()
 def export_attendance():
-    """Export attendance records to CSV"""
+    """Stream attendance records as CSV"""
     try:
         current_user = get_jwt_identity()
         claims = get_jwt()
@@ -388,52 +722,35 @@ def export_attendance():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        # Fetch records
-        if start_date and end_date:
-            records = []
-            current = datetime.strptime(start_date, '%Y-%m-%d')
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            
-            while current <= end:
-                date_str = current.strftime('%Y-%m-%d')
-                if role == 'admin':
-                    day_records = db_manager.get_attendance_by_date(date_str)
-                else:
-                    day_records = db_manager.get_attendance_by_date(date_str, class_code=class_code)
-                records.extend(day_records)
-                current = current + timedelta(days=1)
-        else:
-            if role == 'admin':
-                records = db_manager.get_all_attendance()
-            else:
-                records = db_manager.get_all_attendance(class_code=class_code)
+        try:
+            for value in (start_date, end_date):
+                if value:
+                    datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': 'Dates must be formatted YYYY-MM-DD'
+            }), 400
         
-        if not records:
+        # One range query; rows are fetched in batches while the response streams
+        records = db_manager.iter_attendance(
+            class_code=None if role == 'admin' else class_code,
+            start_date=start_date,
+            end_date=end_date
+        )
+        
+        first = next(records, None)
+        if first is None:
+            records.close()
             return jsonify({
                 'status': 'error',
                 'message': 'No records found for export'
             }), 404
         
-        # Create DataFrame
-        df = pd.DataFrame([{
-            'User ID': r.get('user_id', 'N/A'),
-            'Name': r.get('name', 'Unknown'),
-            'Class': r.get('class_code', 'N/A'),
-            'Date': r.get('date', 'N/A'),
-            'Time': r.get('time', 'N/A'),
-            'Day': datetime.strptime(r.get('date', '2000-01-01'), '%Y-%m-%d').strftime('%A'),
-            'Status': 'Late' if (int(r.get('time', '00:00').split(':')[0]) > 9 or 
-                                 (int(r.get('time', '00:00').split(':')[0]) == 9 and 
-                                  int(r.get('time', '00:00').split(':')[1]) > 30)) else 'On Time'
-        } for r in records])
-        
-        df = df.sort_values(['Date', 'Time'], ascending=[False, True])
-        csv_data = df.to_csv(index=False)
-        
         filename = f'attendance_{class_code}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
         
         return Response(
-            csv_data,
+            _export_rows(first, records),
             mimetype='text/csv',
             headers={
                 'Content-Disposition': f'attachment; filename={filename}',
@@ -478,9 +795,7 @@ def get_user_attendance(user_id):
         
         # Calculate statistics
         total_days = len(user_records)
-        late_days = sum(1 for r in user_records 
-                       if int(r['time'].split(':')[0]) > 9 or 
-                       (int(r['time'].split(':')[0]) == 9 and int(r['time'].split(':')[1]) > 30))
+        late_days = sum(1 for r in user_records if r.get('time', '') >= Config.LATE_ARRIVAL_TIME)
         
         return jsonify({
             'status': 'success',
@@ -507,24 +822,20 @@ def get_user_attendance(user_id):
 def test_blink_detection():
     """Test blink detection with image sequence"""
     try:
-        data = request.get_json()
-        images_data = data.get('images', [])
+        images_data = request_frames(request)
         
-        if len(images_data) < 5:
+        if len(images_data) < Config.BLINK_MIN_FRAMES:
             return jsonify({
-                'error': 'Need at least 5 images'
+                'error': f'Need at least {Config.BLINK_MIN_FRAMES} images'
             }), 400
         
         # Decode images
-        frames = []
-        for img_data in images_data:
-            img_bytes = base64.b64decode(img_data.split(',')[1])
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            frames.append(img)
+        decoded = [pair for pair in decode_frames(images_data, Config.FRAME_WORKING_WIDTH, with_scale=True)
+                   if pair[0] is not None]
+        frames = [img for img, _ in decoded]
         
         # Test blink detection
-        is_live, confidence, reason = check_blink_liveness(frames)
+        is_live, confidence, reason = check_blink_liveness(frames, [scale for _, scale in decoded])
         
         return jsonify({
             'status': 'live' if is_live else 'no_blink',
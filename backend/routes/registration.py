@@ -1,13 +1,12 @@
 from flask import Blueprint, request, jsonify
-import cv2
-import base64
-import numpy as np
-from utils.face_utils import FaceUtils
+from utils.model_registry import get_face_utils
+from utils.frame_decoder import request_fields, request_frames, decode_frame, decode_frames
 from utils.db_manager import DatabaseManager
+from config import Config
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 
 registration_bp = Blueprint('registration', __name__)
-face_utils = FaceUtils()
+face_utils = get_face_utils()
 db_manager = DatabaseManager()
 
 
@@ -25,18 +24,20 @@ def register_user():
         
         print(f"\n===== Registration Request from {class_code} ({class_name}) =====")
         
-        data = request.get_json()
+        data = request_fields(request)
+        images_data = request_frames(request)
         
         # Validate required fields
-        required_fields = ['name', 'email', 'userId', 'images']
+        required_fields = ['name', 'email', 'userId']
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
+        if not images_data and 'images' not in data:
+            return jsonify({'error': 'Missing required field: images'}), 400
         
         name = data['name']
         email = data['email']
         user_id = data['userId']
-        images_data = data['images']
         department = data.get('department', claims.get('department', ''))
         
         # Validate images
@@ -51,33 +52,33 @@ def register_user():
         
         print(f"Processing {len(images_data)} images...")
         
-        for idx, image_data in enumerate(images_data):
-            try:
-                # Decode base64 image
-                img_bytes = base64.b64decode(image_data.split(',')[1])
-                nparr = np.frombuffer(img_bytes, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                # Check if face is detected
-                if not face_utils.detect_face(img):
-                    print(f"  Image {idx+1}: No face detected")
-                    continue
-                
-                # Generate encoding
-                encoding = face_utils.generate_encoding(img)
-                if encoding is not None:
-                    face_encodings.append(encoding)
-                    processed_count += 1
-                    print(f"  Image {idx+1}: ✓ Processed")
-                    
-                    # Save image
-                    face_utils.save_image(img, user_id, idx)
-                else:
-                    print(f"  Image {idx+1}: Failed to generate encoding")
-                    
-            except Exception as e:
-                print(f"  Image {idx+1}: Error - {e}")
+        # Decode all images first (in parallel, at full resolution since
+        # every frame is encoded) so detection can run in batches
+        decoded = []
+        for idx, img in enumerate(decode_frames(images_data)):
+            if img is None:
+                print(f"  Image {idx+1}: Error - could not decode image")
+                continue
+            decoded.append((idx, img))
+        
+        # Detect and encode with batched detector passes
+        analyses = face_utils.analyze_batch([img for _, img in decoded])
+        
+        for (idx, img), analysis in zip(decoded, analyses):
+            if not analysis.has_face:
+                print(f"  Image {idx+1}: No face detected")
                 continue
+            
+            encoding = analysis.encoding
+            if encoding is not None:
+                face_encodings.append(encoding)
+                processed_count += 1
+                print(f"  Image {idx+1}: ✓ Processed")
+                
+                # Save image
+                face_utils.save_image(img, user_id, idx)
+            else:
+                print(f"  Image {idx+1}: Failed to generate encoding")
         
         # Validate minimum encodings
         if len(face_encodings) < 5:
@@ -137,7 +138,8 @@ def get_users():
         print(f"\n===== Fetching users for class: {class_code} =====")
         
         # ONLY get users from this class (no admin override)
-        users = db_manager.get_all_users(class_code=class_code)
+        users = db_manager.get_all_users(class_code=class_code, include_encodings=False)
+        encoding_counts = db_manager.get_encoding_counts(class_code=class_code)
         
         print(f"✓ Found {len(users)} users in {class_code}")
         
@@ -147,7 +149,7 @@ def get_users():
             user_copy = user.copy()
             user_copy.pop('_id', None)
             user_copy.pop('face_encodings', None)
-            user_copy['encodings_count'] = len(user.get('face_encodings', []))
+            user_copy['encodings_count'] = encoding_counts.get(user['user_id'], 0)
             users_list.append(user_copy)
         
         return jsonify({
@@ -187,3 +189,52 @@ def delete_user(user_id):
     except Exception as e:
         print(f"❌ Error deleting user: {e}")
         return jsonify({'error': str(e)}), 500
+
+
+@registration_bp.route('/api/users/search-face', methods=['POST'])
+@jwt_required()
+def search_face():
+    """Search every class for registered users matching a face (admin only)"""
+    try:
+        claims = get_jwt()
+        if claims.get('role') != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        data = request_fields(request)
+        images_data = request_frames(request, field='image', single_field='image')
+        if not images_data:
+            return jsonify({'error': 'No image provided'}), 400
+        
+        img = decode_frame(images_data[0])
+        if img is None:
+            return jsonify({'error': 'Invalid image format'}), 400
+        
+        encoding = face_utils.analyze(img).encoding
+        if encoding is None:
+            return jsonify({'error': 'No face detected'}), 400
+        
+        try:
+            top_k = int(data.get('top_k', 5))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'top_k must be an integer'}), 400
+        top_k = max(1, min(top_k, Config.FACE_SEARCH_MAX_RESULTS))
+        tolerance = Config.FACE_RECOGNITION_TOLERANCE
+        results = db_manager.get_face_index().search(encoding, k=top_k)
+        
+        matches = [{
+            'class_code': class_code,
+            'user_id': user_id,
+            'similarity': round(similarity, 4),
+            'distance': round(1 - similarity, 4),
+            'is_match': similarity > tolerance
+        } for (class_code, user_id), similarity in results]
+        
+        return jsonify({
+            'matches': matches,
+            'count': len(matches),
+            'possible_duplicate': sum(1 for m in matches if m['is_match']) > 1
+        }), 200
+        
+    except Exception as e:
+        print(f"❌ Error searching face: {e}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,347 @@
+import threading
+
+import numpy as np
+from config import Config
+from utils.face_matcher import normalize_encodings
+
+
+class ExactIndex:
+    """
+    Brute-force cosine index
+    Every stored encoding is scored on each search. This is the reference
+    behaviour and the fallback when FACE_INDEX_TYPE = 'exact'.
+    """
+
+    def __init__(self):
+        self.labels = []          # label per internal id (None once removed)
+        self._label_ids = {}      # label -> internal id
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.row_ids = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._label_ids)
+
+    @property
+    def size(self):
+        """Number of stored encodings"""
+        return len(self.row_ids)
+
+    def all_labels(self):
+        return list(self._label_ids)
+
+    def _label_id(self, label):
+        if label not in self._label_ids:
+            self._label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        return self._label_ids[label]
+
+    def add(self, label, encodings):
+        """Add (or extend) a label with one or more encodings"""
+        dim = self.matrix.shape[1] if self.size else None
+        rows = normalize_encodings(encodings, dim)
+        if not len(rows):
+            return
+        label_id = self._label_id(label)
+        ids = np.full(len(rows), label_id, dtype=np.int64)
+        self._append(rows, ids)
+
+    def _append(self, rows, ids):
+        self.matrix = rows if not self.size else np.vstack([self.matrix, rows])
+        self.row_ids = np.concatenate([self.row_ids, ids])
+
+    def remove(self, label):
+        """Remove every encoding stored under label"""
+        return self.remove_many([label]) > 0
+
+    def remove_many(self, labels):
+        """Remove several labels with a single mask over the rows, returns how many existed"""
+        label_ids = []
+        for label in labels:
+            label_id = self._label_ids.pop(label, None)
+            if label_id is not None:
+                self.labels[label_id] = None
+                label_ids.append(label_id)
+        if label_ids:
+            self._drop(np.asarray(label_ids, dtype=np.int64))
+        return len(label_ids)
+
+    def _drop(self, label_ids):
+        keep = ~np.isin(self.row_ids, label_ids)
+        self.matrix = self.matrix[keep]
+        self.row_ids = self.row_ids[keep]
+
+    def _candidates(self, probe):
+        return self.matrix, self.row_ids
+
+    def search(self, face_encoding, k=1):
+        """
+        Top-k labels by best cosine similarity
+        Returns: list of (label, similarity), best first
+        """
+        if not self.size:
+            return []
+
+        probe = normalize_encodings([face_encoding], self.matrix.shape[1])
+        if not len(probe):
+            return []
+        probe = probe[0]
+        matrix, row_ids = self._candidates(probe)
+        if not len(matrix):
+            return []
+
+        similarities = matrix @ probe
+
+        # Only sort the head of the ranking; labels own several rows each
+        head = min(len(similarities), max(k, 1) * 64)
+        if head < len(similarities):
+            order = np.argpartition(-similarities, head - 1)[:head]
+            order = order[np.argsort(-similarities[order], kind='stable')]
+            if len(np.unique(row_ids[order])) < k:
+                order = np.argsort(-similarities, kind='stable')
+        else:
+            order = np.argsort(-similarities, kind='stable')
+
+        results = []
+        seen = set()
+        for row in order:
+            label_id = int(row_ids[row])
+            if label_id in seen:
+                continue
+            seen.add(label_id)
+            results.append((self.labels[label_id], float(similarities[row])))
+            if len(results) >= k:
+                break
+        return results
+
+    def compare_faces(self, face_encoding, tolerance=None):
+        """
+        Same contract as FaceUtils.compare_faces, but returns the matched
+        label instead of a list position: (label, distance) or (None, None)
+        """
+        if tolerance is None:
+            tolerance = Config.FACE_RECOGNITION_TOLERANCE
+
+        results = self.search(face_encoding, k=1)
+        if results and results[0][1] > tolerance:
+            label, similarity = results[0]
+            return label, 1 - similarity
+        return None, None
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file (IVF) approximate index in plain NumPy
+    Encodings are clustered with spherical k-means into nlist cells and a
+    search only scores the nprobe cells closest to the probe. Raising
+    nprobe trades speed for recall; nprobe >= nlist is an exact search.
+    Until the index holds min_train_size encodings it stays untrained and
+    searches exhaustively.
+    """
+
+    def __init__(self, nlist=None, nprobe=None, min_train_size=None, kmeans_iterations=None):
+        super().__init__()
+        self.nlist = nlist or Config.FACE_INDEX_NLIST
+        self.nprobe = nprobe or Config.FACE_INDEX_NPROBE
+        self.min_train_size = min_train_size or Config.FACE_INDEX_MIN_TRAIN_SIZE
+        self.kmeans_iterations = kmeans_iterations or Config.FACE_INDEX_KMEANS_ITERATIONS
+
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_size = 0
+
+        # Rows [0, sorted_size) are grouped by cell, offsets index into them;
+        # rows added since the last regroup sit unsorted in the tail
+        self.sorted_size = 0
+        self.offsets = None
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self, seed=0):
+        """(Re)cluster every stored encoding and rebuild the inverted lists"""
+        if self.size < max(self.nlist, 1):
+            self.centroids = None
+            self.assignments = np.zeros(0, dtype=np.int32)
+            self.sorted_size = 0
+            self.offsets = None
+            return
+
+        rng = np.random.default_rng(seed)
+        centroids = self.matrix[rng.choice(self.size, self.nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmax(self.matrix @ centroids.T, axis=1)
+            for cell in range(self.nlist):
+                members = self.matrix[assignments == cell]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[cell] = centroid / (np.linalg.norm(centroid) + 1e-10)
+
+        self.centroids = centroids
+        self.assignments = np.argmax(self.matrix @ centroids.T, axis=1).astype(np.int32)
+        self.trained_size = self.size
+        self._regroup()
+
+    def _regroup(self):
+        """Sort every row by cell so each inverted list is a contiguous slice"""
+        order = np.argsort(self.assignments, kind='stable')
+        self.matrix = self.matrix[order]
+        self.row_ids = self.row_ids[order]
+        self.assignments = self.assignments[order]
+        self.sorted_size = self.size
+        self._update_offsets()
+
+    def _update_offsets(self):
+        self.offsets = np.searchsorted(
+            self.assignments[:self.sorted_size], np.arange(self.nlist + 1)
+        )
+
+    def _maybe_train(self):
+        # Train once we're big enough, retrain when the data has grown 4x
+        if not self.is_trained and self.size >= self.min_train_size:
+            self.train()
+        elif self.is_trained and self.size > 4 * self.trained_size:
+            self.train()
+        elif self.is_trained and self.size - self.sorted_size > max(self.sorted_size // 4, 256):
+            self._regroup()
+
+    def _append(self, rows, ids):
+        if self.is_trained:
+            cells = np.argmax(rows @ self.centroids[:, :rows.shape[1]].T, axis=1).astype(np.int32)
+            self.assignments = np.concatenate([self.assignments, cells])
+        super()._append(rows, ids)
+        self._maybe_train()
+
+    def _drop(self, label_ids):
+        if self.is_trained:
+            keep = ~np.isin(self.row_ids, label_ids)
+            self.assignments = self.assignments[keep]
+            self.sorted_size = int(keep[:self.sorted_size].sum())
+        super()._drop(label_ids)
+        if self.is_trained:
+            self._update_offsets()
+
+    def _candidates(self, probe):
+        if not self.is_trained or self.nprobe >= self.nlist:
+            return self.matrix, self.row_ids
+
+        cell_scores = self.centroids[:, :len(probe)] @ probe
+        cells = np.argpartition(-cell_scores, self.nprobe - 1)[:self.nprobe]
+
+        rows = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells]
+        if self.sorted_size < self.size:
+            selected = np.zeros(self.nlist, dtype=bool)
+            selected[cells] = True
+            tail = np.flatnonzero(selected[self.assignments[self.sorted_size:]])
+            rows.append(tail + self.sorted_size)
+        rows = np.concatenate(rows)
+        return self.matrix[rows], self.row_ids[rows]
+
+
+def create_face_index(index_type=None, **options):
+    """Build a face index; index_type is 'ivf' or 'exact' (Config.FACE_INDEX_TYPE)"""
+    index_type = (index_type or Config.FACE_INDEX_TYPE).lower()
+    if index_type == 'exact':
+        return ExactIndex()
+    if index_type == 'ivf':
+        return IVFIndex(**options)
+    raise ValueError(f"Unknown face index type: {index_type}")
+
+
+class CampusFaceIndex:
+    """
+    Process-wide face index over every class
+    Labels are (class_code, user_id). It is built lazily on first use and
+    kept current by DatabaseManager.save_user / delete_user in this process,
+    which report the generation they published through mark_published() so
+    it is not reloaded again. Changes made by other processes are picked up
+    by ensure_current(), which reloads every class whose gallery generation
+    has moved.
+    """
+
+    def __init__(self):
+        self.index = None
+        self.generations = {}
+        self._lock = threading.RLock()
+
+    @property
+    def is_loaded(self):
+        return self.index is not None
+
+    def ensure_loaded(self, loader):
+        """Build the index from loader() (a get_all_users() result) if needed"""
+        with self._lock:
+            if self.index is not None:
+                return self
+            index = create_face_index()
+            for user in loader():
+                index.add((user.get('class_code'), user['user_id']), user.get('face_encodings', []))
+            self.index = index
+            print(f"✓ Face index ({type(index).__name__}) built with {len(index)} users, {index.size} encodings")
+            return self
+
+    def ensure_current(self, generations, load_all, load_class):
+        """
+        Bring the index up to date with {class_code: gallery generation}
+        Builds it from load_all() the first time; afterwards reloads only the
+        classes whose generation differs, with load_class(class_code).
+        Generations must be read before loading, so a change that lands in
+        between is reloaded again next time.
+        """
+        with self._lock:
+            if self.index is None:
+                self.ensure_loaded(load_all)
+                self.generations = dict(generations)
+                return self
+
+            stale = [c for c, g in generations.items() if self.generations.get(c) != g]
+            for class_code in stale:
+                self._reload_class(class_code, load_class(class_code))
+            if stale:
+                print(f"✓ Face index refreshed for {len(stale)} changed class(es)")
+            self.generations = dict(generations)
+            return self
+
+    def _reload_class(self, class_code, users):
+        self.index.remove_many([label for label in self.index.all_labels() if label[0] == class_code])
+        for user in users:
+            self.index.add((class_code, user['user_id']), user.get('face_encodings', []))
+
+    def add_user(self, class_code, user_id, encodings):
+        with self._lock:
+            if self.index is not None:
+                self.index.add((class_code, user_id), encodings)
+
+    def remove_user(self, user_id, class_code=None):
+        with self._lock:
+            if self.index is None:
+                return
+            self.index.remove_many([
+                label for label in self.index.all_labels()
+                if label[1] == user_id and (class_code is None or label[0] == class_code)
+            ])
+
+    def mark_published(self, class_code, generation):
+        """
+        Record a generation this process published and already applied
+        Only advances a class that was current up to the generation before,
+        so a change from another process in between is still reloaded.
+        """
+        with self._lock:
+            if self.index is not None and self.generations.get(class_code, 0) == generation - 1:
+                self.generations[class_code] = generation
+
+    def search(self, face_encoding, k=5):
+        with self._lock:
+            return self.index.search(face_encoding, k) if self.index is not None else []
+
+    def compare_faces(self, face_encoding, tolerance=None):
+        with self._lock:
+            if self.index is None:
+                return None, None
+            return self.index.compare_faces(face_encoding, tolerance)
+
+
+# Shared by every DatabaseManager instance in this process
+campus_index = CampusFaceIndex()
@@ -1,20 +1,128 @@
 import cv2
 import numpy as np
 from scipy.spatial import distance as dist
+from config import Config
+from utils.cascades import (
+    detect_multiscale, scaled_min_size, FACE_CASCADE, EYE_CASCADE, FACE_MIN_SIZE, EYE_MIN_SIZE
+)
+
+
+class FaceTracker:
+    """
+    Follows one face across a short frame sequence
+    The face is detected once with a Haar cascade, then located in later
+    frames by template matching inside a window around its last position.
+    The detector only runs again when the match score drops below
+    min_score, which is rare while the subject holds still for a blink.
+    Frames without a box fall back to a full-frame eye search.
+    """
+    
+    def __init__(self, min_score=None, search_margin=0.5, max_misses=2):
+        if min_score is None:
+            min_score = Config.FACE_TRACK_MIN_SCORE
+        self.min_score = min_score        # TM_CCOEFF_NORMED score to trust the track
+        self.search_margin = search_margin  # Search window padding, as a fraction of the box
+        self.max_misses = max_misses      # Consecutive failed detections before giving up
+        self.reset()
+    
+    def reset(self):
+        self.box = None
+        self.template = None
+        self.detections = 0
+        self.tracked = 0
+        self.misses = 0
+    
+    def detect(self, gray, scale=1.0):
+        """Largest face in a grayscale frame as (x, y, w, h), or None"""
+        faces = detect_multiscale(FACE_CASCADE, gray, 1.1, 5, minSize=scaled_min_size(FACE_MIN_SIZE, scale))
+        self.detections += 1
+        if len(faces) == 0:
+            return None
+        return tuple(int(v) for v in max(faces, key=lambda rect: rect[2] * rect[3]))
+    
+    def _match(self, gray):
+        (x, y, w, h) = self.box
+        pad_x = int(w * self.search_margin)
+        pad_y = int(h * self.search_margin)
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        x1 = min(gray.shape[1], x + w + pad_x)
+        y1 = min(gray.shape[0], y + h + pad_y)
+        window = gray[y0:y1, x0:x1]
+        
+        if window.shape[0] < h or window.shape[1] < w:
+            return None, 0.0
+        
+        scores = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx, my) = cv2.minMaxLoc(scores)
+        return (x0 + mx, y0 + my, w, h), score
+    
+    def update(self, gray, scale=1.0):
+        """
+        Locate the face in the next grayscale frame, returns (x, y, w, h) or None
+        scale: fraction of full resolution the frame was decoded at
+        """
+        if self.box is not None:
+            box, score = self._match(gray)
+            if box is not None and score >= self.min_score:
+                self.box = box
+                self.tracked += 1
+                return box
+        
+        # No face in several frames running: stop paying for the detector
+        if self.misses >= self.max_misses:
+            self.box = None
+            return None
+        
+        # Lost (or never had) the face: fall back to the detector
+        box = self.detect(gray, scale)
+        self.box = box
+        if box is None:
+            self.misses += 1
+            return None
+        
+        self.misses = 0
+        (x, y, w, h) = box
+        self.template = gray[y:y+h, x:x+w].copy()
+        return box
+    
+    def track(self, frames):
+        """Face box (or None) for every BGR frame in the sequence"""
+        self.reset()
+        return [self.update(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)) for frame in frames]
+
+
+def eye_search_region(gray, face_box):
+    """
+    Crop to the part of the face where eyes can be
+    Returns: (region, (offset_x, offset_y)); the full frame if there is no face box
+    """
+    if face_box is None:
+        return gray, (0, 0)
+    (x, y, w, h) = face_box
+    # Eyes sit in the upper ~60% of a frontal face box
+    return gray[y:y + int(h * 0.6), x:x + w], (x, y)
+
+
+class EyeObservation:
+    """Eye analysis of one frame, computed once and shared by every check"""
+    
+    def __init__(self, eyes, ear):
+        self.eyes = eyes
+        self.eye_count = len(eyes)
+        self.has_eyes = len(eyes) >= 2
+        self.ear = ear
 
 
 class BlinkDetector:
     """
     Real-time blink detection for liveness verification
     Detects eye blinks to ensure it's a real person
+    Holds no per-request state, so one instance is shared by all requests;
+    cascades come from the process-wide pool in utils.cascades.
     """
     
     def __init__(self):
-        self.eye_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_eye.xml'
-        )
-        self.EYE_AR_THRESH = 0.25  # Eye aspect ratio threshold for blink
-        self.EYE_AR_CONSEC_FRAMES = 2  # Consecutive frames for blink
+        self.MIN_EAR_DROP = Config.BLINK_MIN_EAR_DROP  # Mean-to-min EAR drop that counts as a blink
     
     def eye_aspect_ratio(self, eye):
         """Calculate eye aspect ratio (EAR)"""
@@ -27,24 +135,69 @@ class BlinkDetector:
         ear = (A + B) / (2.0 * C)
         return ear
     
-    def detect_eyes_simple(self, image):
+    def analyze_eyes(self, gray, face_box=None, scale=1.0):
+        """
+        Single eye-detection pass over one grayscale frame
+        face_box: optional (x, y, w, h) to restrict the search to
+        scale: fraction of full resolution the frame was decoded at
+        Returns: EyeObservation with the eye boxes and the frame's EAR
+        """
+        region, _ = eye_search_region(gray, face_box)
+        
+        # Detect eyes
+        eyes = detect_multiscale(
+            EYE_CASCADE,
+            region,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=scaled_min_size(EYE_MIN_SIZE, scale)
+        )
+        
+        if len(eyes) >= 2:
+            # Get largest two eyes
+            sorted_eyes = sorted(eyes, key=lambda x: x[2] * x[3], reverse=True)[:2]
+            
+            # Calculate aspect ratio for both eyes
+            ratios = []
+            for (ex, ey, ew, eh) in sorted_eyes:
+                eye_roi = region[ey:ey+eh, ex:ex+ew]
+                ratios.append(self.calculate_simple_ear(eye_roi))
+            
+            ear = np.mean(ratios) if ratios else 0
+        else:
+            ear = 0  # No eyes detected
+        
+        return EyeObservation(eyes, ear)
+    
+    def observe(self, frame, tracker=None, scale=1.0):
+        """Grayscale, track and analyze eyes for one frame"""
+        try:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            face_box = tracker.update(gray, scale) if tracker is not None else None
+            return self.analyze_eyes(gray, face_box, scale)
+        except Exception as e:
+            print(f"Eye detection error: {e}")
+            return EyeObservation([], 0)
+    
+    def analyze_sequence(self, frame_sequence, tracker=None):
+        """
+        Grayscale, track and analyze eyes once per frame
+        Returns: list of EyeObservation, one per frame
+        """
+        if tracker is not None:
+            tracker.reset()
+        return [self.observe(frame, tracker) for frame in frame_sequence]
+    
+    def detect_eyes_simple(self, image, face_box=None):
         """
         Simple eye detection to check for eye presence
+        face_box: optional (x, y, w, h) to restrict the search to
         Returns: (has_eyes, eye_count, eye_regions)
         """
         try:
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Detect eyes
-            eyes = self.eye_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(20, 20)
-            )
-            
-            has_eyes = len(eyes) >= 2
-            return has_eyes, len(eyes), eyes
+            observation = self.analyze_eyes(gray, face_box)
+            return observation.has_eyes, observation.eye_count, observation.eyes
             
         except Exception as e:
             print(f"Eye detection error: {e}")
@@ -65,87 +218,219 @@ class BlinkDetector:
         except:
             return 0.3  # Default value
     
-    def is_blink_detected(self, frame_sequence):
+    def is_blink_detected(self, frame_sequence, face_boxes=None):
         """
         Analyze sequence of frames to detect blink
         frame_sequence: list of images captured over time
+        face_boxes: optional tracked face box per frame
         Returns: (blink_detected, confidence)
         """
         try:
             if len(frame_sequence) < 3:
                 return False, 0, "Need at least 3 frames"
             
-            eye_states = []
+            if face_boxes is None:
+                face_boxes = [None] * len(frame_sequence)
             
-            for frame in frame_sequence:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                eyes = self.eye_cascade.detectMultiScale(
-                    gray, 1.1, 5, minSize=(20, 20)
-                )
-                
-                if len(eyes) >= 2:
-                    # Get largest two eyes
-                    sorted_eyes = sorted(eyes, key=lambda x: x[2] * x[3], reverse=True)[:2]
-                    
-                    # Calculate aspect ratio for both eyes
-                    ratios = []
-                    for (ex, ey, ew, eh) in sorted_eyes:
-                        eye_roi = gray[ey:ey+eh, ex:ex+ew]
-                        ear = self.calculate_simple_ear(eye_roi)
-                        ratios.append(ear)
-                    
-                    avg_ratio = np.mean(ratios) if ratios else 0
-                    eye_states.append(avg_ratio)
-                else:
-                    eye_states.append(0)  # No eyes detected
-            
-            if len(eye_states) < 3:
-                return False, 0, "Insufficient eye data"
-            
-            # Check for blink pattern: open -> closed -> open
-            # Look for a dip in the eye aspect ratio
-            mean_ratio = np.mean(eye_states)
-            min_ratio = np.min(eye_states)
-            
-            # Blink detected if there's a significant drop
-            blink_detected = (mean_ratio - min_ratio) > 0.05
-            confidence = min(((mean_ratio - min_ratio) / 0.15) * 100, 100)
-            
-            print(f"  Eye states: {[f'{x:.3f}' for x in eye_states]}")
-            print(f"  Mean: {mean_ratio:.3f}, Min: {min_ratio:.3f}, Drop: {mean_ratio - min_ratio:.3f}")
-            
-            if blink_detected:
-                return True, confidence, "Blink pattern detected"
-            else:
-                return False, confidence, "No blink detected - please blink"
+            eye_states = [
+                self.analyze_eyes(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), face_box).ear
+                for frame, face_box in zip(frame_sequence, face_boxes)
+            ]
+            return self.evaluate_ear_series(eye_states)
                 
         except Exception as e:
             print(f"Blink detection error: {e}")
             return False, 0, str(e)
+    
+    def evaluate_ear_series(self, eye_states):
+        """
+        Decide whether an EAR time-series contains a blink
+        Returns: (blink_detected, confidence, reason)
+        """
+        if len(eye_states) < 3:
+            return False, 0, "Insufficient eye data"
+        
+        # Check for blink pattern: open -> closed -> open
+        # Look for a dip in the eye aspect ratio
+        mean_ratio = np.mean(eye_states)
+        min_ratio = np.min(eye_states)
+        
+        # Blink detected if there's a significant drop
+        blink_detected = (mean_ratio - min_ratio) > self.MIN_EAR_DROP
+        confidence = min(((mean_ratio - min_ratio) / 0.15) * 100, 100)
+        
+        print(f"  Eye states: {[f'{x:.3f}' for x in eye_states]}")
+        print(f"  Mean: {mean_ratio:.3f}, Min: {min_ratio:.3f}, Drop: {mean_ratio - min_ratio:.3f}")
+        
+        if blink_detected:
+            return True, confidence, "Blink pattern detected"
+        else:
+            return False, confidence, "No blink detected - please blink"
+
+
+# Shared by every request; see BlinkDetector
+blink_detector = BlinkDetector()
 
 
-def check_blink_liveness(images_sequence):
+class BlinkLivenessEvaluator:
     """
-    Main function to check liveness via blink detection
-    images_sequence: list of at least 5 images captured in sequence
+    Incremental blink liveness check
+    Frames are fed one at a time and the verdict is reached as soon as the
+    evidence allows, so callers can stop decoding the rest:
+      - live: an open -> closed -> open dip deeper than BLINK_MIN_EAR_DROP
+        on both sides, and enough eye frames that BLINK_MIN_EYE_PRESENCE
+        holds for expected_frames whatever the remaining frames show
+      - not live: eyes can no longer be present in BLINK_MIN_EYE_PRESENCE
+        of expected_frames, however the remaining frames turn out
+    Anything still undecided when the frames run out gets the full-sequence
+    rules of check_blink_liveness via finish().
     """
-    detector = BlinkDetector()
     
-    if len(images_sequence) < 5:
-        return False, 0, "Need at least 5 frames for blink detection"
+    PENDING = 'pending'
+    LIVE = 'live'
+    NOT_LIVE = 'not_live'
+    
+    def __init__(self, expected_frames=None, detector=None):
+        self.detector = detector or blink_detector
+        self.tracker = FaceTracker()
+        self.expected_frames = expected_frames
+        self.observations = []
+        self.state = self.PENDING
+        self.confidence = 0
+        self.reason = 'Waiting for frames'
+        
+        # Running state for dip detection
+        self._peak_before = None  # Highest open-eye EAR seen so far
+        self._deepest_dip = None  # Lowest EAR after that peak, (ear, peak)
+        self._blink = None        # Completed dip, (before, dip, after)
+    
+    @property
+    def frames_seen(self):
+        return len(self.observations)
     
-    # Check if eyes are present in most frames
-    eye_detections = []
-    for img in images_sequence:
-        has_eyes, count, _ = detector.detect_eyes_simple(img)
-        eye_detections.append(has_eyes)
+    @property
+    def eyes_present(self):
+        return sum(o.has_eyes for o in self.observations)
     
-    eyes_present_rate = sum(eye_detections) / len(eye_detections)
+    @property
+    def result(self):
+        """(is_live, confidence, reason)"""
+        return self.state == self.LIVE, self.confidence, self.reason
     
-    if eyes_present_rate < 0.6:  # Eyes should be present in 60%+ frames
-        return False, 0, "Eyes not consistently detected"
+    def feed(self, frame, scale=1.0):
+        """
+        Analyze the next frame, returns the evaluator state
+        scale: fraction of full resolution the frame was decoded at
+        """
+        if self.state != self.PENDING:
+            return self.state
+        
+        observation = self.detector.observe(frame, self.tracker, scale)
+        self.observations.append(observation)
+        self._update_dip(observation)
+        self._decide()
+        return self.state
+    
+    def _update_dip(self, observation):
+        ear = observation.ear
+        
+        # A candidate dip needs an open-eye peak before it
+        if self._peak_before is not None and self._peak_before - ear > self.detector.MIN_EAR_DROP:
+            if self._deepest_dip is None or ear < self._deepest_dip[0]:
+                self._deepest_dip = (ear, self._peak_before)
+            return
+        
+        # Recovery: eyes open again clearly above the dip completes the blink
+        if (self._deepest_dip is not None and observation.has_eyes and
+                ear - self._deepest_dip[0] > self.detector.MIN_EAR_DROP):
+            self._blink = (self._deepest_dip[1], self._deepest_dip[0], ear)
+        
+        if observation.has_eyes and (self._peak_before is None or ear > self._peak_before):
+            self._peak_before = ear
+    
+    def _decide(self):
+        seen = self.frames_seen
+        present = self.eyes_present
+        min_presence = Config.BLINK_MIN_EYE_PRESENCE
+        
+        if self.expected_frames:
+            best_case = (present + max(self.expected_frames - seen, 0)) / self.expected_frames
+            if best_case < min_presence:
+                self._settle(self.NOT_LIVE, 0, "Eyes not consistently detected")
+                return
+        
+        if self._blink is None or seen < Config.BLINK_MIN_FRAMES:
+            return
+        
+        # Eye presence must already hold for the whole sequence
+        if present / (self.expected_frames or seen) < min_presence:
+            return
+        
+        before, dip, after = self._blink
+        drop = min(before, after) - dip
+        confidence = min((drop / 0.15) * 100, 100)
+        print(f"  Blink dip: {before:.3f} -> {dip:.3f} -> {after:.3f} after {seen} frames")
+        self._settle(self.LIVE, confidence, "Blink pattern detected")
+    
+    def _settle(self, state, confidence, reason):
+        self.state = state
+        self.confidence = confidence
+        self.reason = reason
+    
+    def finish(self):
+        """Final verdict over every frame fed so far, returns (is_live, confidence, reason)"""
+        if self.state != self.PENDING:
+            return self.result
+        
+        if self.frames_seen < Config.BLINK_MIN_FRAMES:
+            self._settle(self.NOT_LIVE, 0, f"Need at least {Config.BLINK_MIN_FRAMES} frames for blink detection")
+            return self.result
+        
+        # Check if eyes are present in most frames
+        if self.eyes_present / self.frames_seen < Config.BLINK_MIN_EYE_PRESENCE:
+            self._settle(self.NOT_LIVE, 0, "Eyes not consistently detected")
+            return self.result
+        
+        # Detect blink from the same observations
+        try:
+            is_live, confidence, reason = self.detector.evaluate_ear_series(
+                [o.ear for o in self.observations]
+            )
+        except Exception as e:
+            print(f"Blink detection error: {e}")
+            is_live, confidence, reason = False, 0, str(e)
+        
+        self._settle(self.LIVE if is_live else self.NOT_LIVE, confidence, reason)
+        return self.result
+    
+    def best_frame_index(self):
+        """Index of the eyes-open frame closest to the middle of those seen"""
+        middle = self.frames_seen // 2
+        open_frames = [i for i, o in enumerate(self.observations) if o.has_eyes]
+        if not open_frames:
+            return middle
+        return min(open_frames, key=lambda i: abs(i - middle))
+
+
+def check_blink_liveness(images_sequence, scales=None):
+    """
+    Main function to check liveness via blink detection
+    images_sequence: list of at least 5 images captured in sequence
+    scales: optional decode scale per image, see decode_frame(with_scale=True)
+    Stops analyzing frames as soon as the verdict is clear.
+    """
+    if len(images_sequence) < Config.BLINK_MIN_FRAMES:
+        return False, 0, f"Need at least {Config.BLINK_MIN_FRAMES} frames for blink detection"
     
-    # Detect blink
-    blink_detected, confidence, reason = detector.is_blink_detected(images_sequence)
+    # One pass per frame: grayscale, follow the face, find eyes inside it
+    evaluator = BlinkLivenessEvaluator(expected_frames=len(images_sequence))
+    if scales is None:
+        scales = [1.0] * len(images_sequence)
+    for frame, scale in zip(images_sequence, scales):
+        if evaluator.feed(frame, scale) != BlinkLivenessEvaluator.PENDING:
+            break
     
-    return blink_detected, confidence, reason
+    tracker = evaluator.tracker
+    print(f"  Analyzed {evaluator.frames_seen}/{len(images_sequence)} frames; "
+          f"face tracking: {tracker.detections} detector runs, {tracker.tracked} tracked frames")
+    return evaluator.finish()
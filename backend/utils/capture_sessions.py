@@ -0,0 +1,127 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from config import Config
+from utils.blink_detector import BlinkLivenessEvaluator
+
+
+class CaptureSession:
+    """
+    One kiosk capture in progress
+    Frames are fed to a BlinkLivenessEvaluator as they arrive, so the
+    liveness verdict is ready as soon as the blink has been seen rather
+    than after the whole burst has been uploaded. Once settled the final
+    response is kept so a retried upload gets the same answer.
+    """
+
+    def __init__(self, class_code, class_name, expected_frames):
+        self.session_id = uuid.uuid4().hex
+        self.class_code = class_code
+        self.class_name = class_name
+        self.expected_frames = expected_frames
+        self.evaluator = BlinkLivenessEvaluator(expected_frames=expected_frames)
+        self.payloads = []
+        self.frames_received = 0
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.response = None
+        self.lock = threading.Lock()
+
+    @property
+    def complete(self):
+        return self.response is not None
+
+    @property
+    def exhausted(self):
+        """True once every expected frame has been received"""
+        return self.frames_received >= self.expected_frames
+
+    def add_frame(self, frame, payload, scale=1.0):
+        """
+        Feed one decoded frame (None for an undecodable one), returns
+        evaluator state. The encoded payload is kept so the recognition
+        frame can be decoded again at full resolution; scale is the
+        fraction of full resolution the frame was decoded at.
+        """
+        self.frames_received += 1
+        self.updated_at = time.time()
+        if frame is None or self.evaluator.state != BlinkLivenessEvaluator.PENDING:
+            return self.evaluator.state
+
+        self.payloads.append(payload)
+        return self.evaluator.feed(frame, scale)
+
+    def best_payload(self):
+        """Encoded frame to run recognition on"""
+        return self.payloads[self.evaluator.best_frame_index()]
+
+    def finish(self, response):
+        """Record the final response and release the buffered frames"""
+        self.response = response
+        self.payloads = []
+
+
+class CaptureSessionStore:
+    """
+    In-process registry of open capture sessions
+    Sessions live in memory, so a kiosk must keep talking to the same
+    worker for the few seconds a capture takes. Idle sessions expire after
+    CAPTURE_SESSION_TTL_SECONDS and the oldest are dropped beyond
+    CAPTURE_SESSION_MAX_ACTIVE.
+    """
+
+    def __init__(self, max_active=None, ttl_seconds=None):
+        self.max_active = max_active or Config.CAPTURE_SESSION_MAX_ACTIVE
+        self.ttl_seconds = ttl_seconds or Config.CAPTURE_SESSION_TTL_SECONDS
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.expired = 0
+
+    def create(self, class_code, class_name, expected_frames=None):
+        expected = int(expected_frames or Config.CAPTURE_SESSION_FRAMES)
+        expected = max(Config.BLINK_MIN_FRAMES, min(expected, Config.CAPTURE_SESSION_MAX_FRAMES))
+        session = CaptureSession(class_code, class_name, expected)
+
+        with self._lock:
+            self._expire()
+            while len(self._sessions) >= self.max_active:
+                self._sessions.popitem(last=False)
+                self.expired += 1
+            self._sessions[session.session_id] = session
+            self.created += 1
+        return session
+
+    def get(self, session_id, class_code):
+        """Open session owned by class_code, or None"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+        if session is None or session.class_code != class_code:
+            return None
+        return session
+
+    def discard(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        stale = [sid for sid, s in self._sessions.items() if s.updated_at < cutoff]
+        for sid in stale:
+            del self._sessions[sid]
+        self.expired += len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self._sessions),
+                'created': self.created,
+                'expired': self.expired
+            }
+
+
+capture_sessions = CaptureSessionStore()
@@ -0,0 +1,59 @@
+import threading
+
+import cv2
+
+from config import Config
+from utils.detector_pool import DetectorPool
+
+FACE_CASCADE = 'haarcascade_frontalface_default.xml'
+EYE_CASCADE = 'haarcascade_eye.xml'
+
+# Smallest face and eye worth reporting, in full-resolution pixels
+FACE_MIN_SIZE = (50, 50)
+EYE_MIN_SIZE = (20, 20)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _load_cascade(filename):
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + filename)
+    if cascade.empty():
+        raise RuntimeError(f"Could not load Haar cascade {filename}")
+    return cascade
+
+
+def cascade_pool(filename):
+    """
+    Process-wide checkout pool of Haar cascades for one file
+    CascadeClassifier.detectMultiScale is not safe to call concurrently on
+    one instance, so each call borrows its own. Instances are parsed lazily
+    up to DETECTOR_POOL_SIZE and then reused by every request thread,
+    including the short-lived ones the development server starts.
+    """
+    with _pools_lock:
+        pool = _pools.get(filename)
+        if pool is None:
+            pool = _pools[filename] = DetectorPool(lambda: _load_cascade(filename), Config.DETECTOR_POOL_SIZE)
+        return pool
+
+
+def detect_multiscale(filename, image, *args, **kwargs):
+    """detectMultiScale with a cascade checked out from the shared pool"""
+    with cascade_pool(filename).checkout(Config.DETECTOR_POOL_TIMEOUT_SECONDS) as cascade:
+        return cascade.detectMultiScale(image, *args, **kwargs)
+
+
+def scaled_min_size(size, scale=1.0):
+    """
+    minSize for a frame decoded at `scale` of full resolution
+    Keeps the full-resolution floor meaning the same physical size, so a
+    face that passes at full resolution still passes at 1/2 or 1/4 scale.
+    """
+    return tuple(max(1, int(round(v * scale))) for v in size)
+
+
+def stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {filename: pool.stats() for filename, pool in pools.items()}
@@ -1,9 +1,20 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.write_concern import WriteConcern
 from datetime import datetime
 from config import Config
+from utils.gallery_cache import gallery_cache, GalleryEntry
+from utils.gallery_snapshot import snapshot_store
+from utils.ann_index import campus_index
+from utils.encoding_codec import encode_encoding, decode_encoding, ENCODING_PROJECTION
+from utils.index_manager import bootstrap_indexes, daily_rollup_group, DAILY_ROLLUP_MIGRATION
 import certifi
 
 
+def _only_duplicate_keys(error):
+    return all(err.get('code') == 11000 for err in error.details.get('writeErrors', []))
+
+
 class DatabaseManager:
     def __init__(self):
         try:
@@ -22,6 +33,18 @@ class DatabaseManager:
             self.users = self.db['users']
             self.face_encodings = self.db['face_encodings']
             self.attendance = self.db['attendance']
+            self.attendance_daily = self.db['attendance_daily']
+            self.gallery_meta = self.db['gallery_meta']
+            
+            # Registration writes wait for the configured acknowledgement
+            self.write_concern = WriteConcern(w=Config.DB_WRITE_CONCERN, j=Config.DB_WRITE_JOURNAL)
+            self._registration_users = self.users.with_options(write_concern=self.write_concern)
+            self._registration_encodings = self.face_encodings.with_options(write_concern=self.write_concern)
+            self._transactions = None
+            self._rollup_applied = False
+            
+            if Config.DB_INDEX_BOOTSTRAP:
+                bootstrap_indexes(self.db)
             
         except Exception as e:
             print(f"❌ MongoDB connection error: {e}")
@@ -29,43 +52,142 @@ class DatabaseManager:
     
     def save_user(self, user_data):
         """Save new user with class assignment"""
+        return self.save_users([user_data])[0]
+    
+    def save_users(self, users_data):
+        """
+        Save many new users with their face encodings
+        Users are written REGISTRATION_BATCH_USERS at a time with one
+        insert_many for the users and one for all their encodings, inside a
+        transaction when the deployment supports them. Users that already
+        exist in their class are skipped.
+        Returns: inserted id (str) per input user, None if it was not saved
+        """
+        results = [None] * len(users_data)
         try:
-            encodings = user_data.pop('face_encodings', [])
+            now = datetime.now()
+            pending = []
+            seen = set()
             
-            # Check if user already exists in this class
-            existing = self.users.find_one({
-                'user_id': user_data['user_id'],
-                'class_code': user_data.get('class_code')
-            })
-            if existing:
-                print(f"User {user_data['user_id']} already exists in {user_data.get('class_code')}")
-                return None
-            
-            # Add metadata
-            user_data['created_at'] = datetime.now()
-            user_data['is_active'] = True
-            user_data['class_code'] = user_data.get('class_code', 'GENERAL')  # Required field
-            
-            result = self.users.insert_one(user_data)
-            user_id = user_data['user_id']
-            class_code = user_data['class_code']
-            
-            # Save face encodings with class reference
-            for idx, encoding in enumerate(encodings):
-                self.face_encodings.insert_one({
-                    'user_id': user_id,
-                    'class_code': class_code,
-                    'encoding_index': idx,
-                    'encoding': encoding,
-                    'created_at': datetime.now()
-                })
-            
-            print(f"✓ User {user_id} saved in class {class_code} with {len(encodings)} face encodings")
-            return str(result.inserted_id)
+            for position, user_data in enumerate(users_data):
+                encodings = user_data.pop('face_encodings', [])
+                
+                # Add metadata
+                user_data['created_at'] = now
+                user_data['is_active'] = True
+                user_data['class_code'] = user_data.get('class_code') or 'GENERAL'  # Required field
+                
+                key = (user_data['user_id'], user_data['class_code'])
+                if key in seen:
+                    print(f"User {key[0]} appears more than once for {key[1]}, keeping the first")
+                    continue
+                seen.add(key)
+                pending.append((position, user_data, encodings))
+            
+            batch_size = max(1, Config.REGISTRATION_BATCH_USERS)
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                saved = self._run_write(lambda session: self._write_registrations(batch, session))
+                
+                by_class = {}
+                for position, user_data, encodings in saved:
+                    results[position] = str(user_data['_id'])
+                    by_class.setdefault(user_data['class_code'], []).append((user_data, encodings))
+                
+                for class_code, users in by_class.items():
+                    generation = self._publish_gallery_change(class_code, {'_id': {'$in': [u['_id'] for u, _ in users]}})
+                    for user_data, encodings in users:
+                        gallery_cache.add_user(class_code, user_data, encodings)
+                        campus_index.add_user(class_code, user_data['user_id'], encodings)
+                        print(f"✓ User {user_data['user_id']} saved in class {class_code} "
+                              f"with {len(encodings)} face encodings")
+                    campus_index.mark_published(class_code, generation)
+            
+            return results
             
         except Exception as e:
             print(f"❌ Error saving user: {e}")
-            return None
+            return results
+    
+    def _write_registrations(self, batch, session=None):
+        """
+        Insert a batch of (position, user_data, encodings), skipping users
+        that already exist in their class. Returns the entries written.
+        """
+        by_class = {}
+        for _, user_data, _ in batch:
+            by_class.setdefault(user_data['class_code'], []).append(user_data['user_id'])
+        
+        # Check which users already exist, one query for the whole batch
+        existing = {
+            (doc['user_id'], doc['class_code'])
+            for doc in self._registration_users.find(
+                {'$or': [{'class_code': c, 'user_id': {'$in': ids}} for c, ids in by_class.items()]},
+                {'user_id': 1, 'class_code': 1},
+                session=session
+            )
+        }
+        
+        new = []
+        for entry in batch:
+            user_data = entry[1]
+            if (user_data['user_id'], user_data['class_code']) in existing:
+                print(f"User {user_data['user_id']} already exists in {user_data['class_code']}")
+            else:
+                # A retried transaction must not reuse ids from the aborted attempt
+                user_data.pop('_id', None)
+                new.append(entry)
+        if not new:
+            return []
+        
+        self._registration_users.insert_many([u for _, u, _ in new], session=session)
+        
+        # Save face encodings with class reference
+        now = datetime.now()
+        documents = [
+            {
+                'user_id': user_data['user_id'],
+                'class_code': user_data['class_code'],
+                'encoding_index': idx,
+                **encode_encoding(encoding),
+                'created_at': now
+            }
+            for _, user_data, encodings in new
+            for idx, encoding in enumerate(encodings)
+        ]
+        if documents:
+            try:
+                self._registration_encodings.insert_many(documents, ordered=False, session=session)
+            except Exception:
+                if session is None:
+                    # No transaction to roll back; remove the partial registration
+                    self._discard_registrations([u for _, u, _ in new])
+                raise
+        return new
+    
+    def _discard_registrations(self, users):
+        self.users.delete_many({'_id': {'$in': [u['_id'] for u in users]}})
+        for user in users:
+            self.face_encodings.delete_many({'user_id': user['user_id'], 'class_code': user['class_code']})
+    
+    def _run_write(self, callback):
+        """
+        Run callback(session) in a transaction on replica sets and sharded
+        clusters, or directly with session None on a standalone server
+        """
+        if not self._supports_transactions():
+            return callback(None)
+        with self.client.start_session() as session:
+            return session.with_transaction(callback, write_concern=self.write_concern)
+    
+    def _supports_transactions(self):
+        if self._transactions is None:
+            try:
+                hello = self.client.admin.command('hello')
+                self._transactions = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+            except Exception:
+                self._transactions = False
+        return self._transactions
     
     def get_user_by_id(self, user_id, class_code=None):
         """Get user with optional class filter"""
@@ -78,29 +200,28 @@ class DatabaseManager:
             if user:
                 encodings = list(self.face_encodings.find(
                     {'user_id': user_id, 'class_code': user.get('class_code')},
-                    {'encoding': 1, '_id': 0}
+                    ENCODING_PROJECTION
                 ).sort('encoding_index', 1))
-                user['face_encodings'] = [e['encoding'] for e in encodings]
+                user['face_encodings'] = [decode_encoding(e) for e in encodings]
             return user
         except Exception as e:
             print(f"❌ Error getting user: {e}")
             return None
     
-    def get_all_users(self, class_code=None):
-        """Get all active users filtered by class"""
+    def get_all_users(self, class_code=None, include_encodings=True):
+        """
+        Get all active users filtered by class
+        include_encodings=False skips loading face encodings for callers
+        that only need the user records.
+        """
         try:
             query = {'is_active': True}
             if class_code:
                 query['class_code'] = class_code
             
             users = list(self.users.find(query))
-            
-            for user in users:
-                encodings = list(self.face_encodings.find(
-                    {'user_id': user['user_id'], 'class_code': user.get('class_code')},
-                    {'encoding': 1, '_id': 0}
-                ).sort('encoding_index', 1))
-                user['face_encodings'] = [e['encoding'] for e in encodings]
+            if include_encodings:
+                self._attach_encodings(users, class_code)
             
             print(f"✓ Retrieved {len(users)} users" + (f" from class {class_code}" if class_code else ""))
             return users
@@ -108,41 +229,339 @@ class DatabaseManager:
             print(f"❌ Error getting users: {e}")
             return []
     
+    def _attach_encodings(self, users, class_code=None):
+        """
+        Load face encodings for many users with one query
+        Encodings are grouped in memory by (user_id, class_code) and set as
+        each user's face_encodings, ordered by encoding_index.
+        """
+        if not users:
+            return users
+        
+        query = {'user_id': {'$in': list({u['user_id'] for u in users})}}
+        if class_code:
+            query['class_code'] = class_code
+        
+        grouped = {}
+        for doc in self.face_encodings.find(
+            query,
+            {**ENCODING_PROJECTION, 'user_id': 1, 'class_code': 1}
+        ).sort([('user_id', 1), ('encoding_index', 1)]):
+            grouped.setdefault((doc['user_id'], doc.get('class_code')), []).append(decode_encoding(doc))
+        
+        for user in users:
+            user['face_encodings'] = grouped.get((user['user_id'], user.get('class_code')), [])
+        return users
+    
+    def get_encoding_counts(self, class_code=None):
+        """Number of stored face encodings per user_id, without loading them"""
+        try:
+            pipeline = []
+            if class_code:
+                pipeline.append({'$match': {'class_code': class_code}})
+            pipeline.append({'$group': {'_id': '$user_id', 'count': {'$sum': 1}}})
+            return {doc['_id']: doc['count'] for doc in self.face_encodings.aggregate(pipeline)}
+        except Exception as e:
+            print(f"❌ Error counting encodings: {e}")
+            return {}
+    
+    def get_class_gallery(self, class_code=None):
+        """Get the cached face gallery for a class, loading it on a miss"""
+        return gallery_cache.get_or_load(
+            class_code,
+            lambda: self._load_class_gallery(class_code)
+        )
+    
+    def _load_class_gallery(self, class_code):
+        """Build a class gallery from its disk snapshot, topped up from MongoDB"""
+        if class_code is None or not Config.GALLERY_SNAPSHOTS_ENABLED:
+            return self.get_all_users(class_code=class_code)
+        
+        generation, settled = self._gallery_state(class_code)
+        snapshot = snapshot_store.load(class_code)
+        
+        if snapshot is not None and snapshot.generation == generation:
+            print(f"✓ Gallery for {class_code} mapped from snapshot (generation {generation})")
+            return GalleryEntry.from_snapshot(snapshot)
+        
+        if snapshot is not None and snapshot.generation < generation:
+            entry = GalleryEntry.from_snapshot(snapshot)
+            label = self._apply_gallery_changes(entry, snapshot.generation, generation, settled)
+            print(f"✓ Gallery for {class_code} updated from generation {snapshot.generation} to {label}")
+        else:
+            entry = GalleryEntry(class_code, self.get_all_users(class_code=class_code))
+            label = generation
+        
+        snapshot_store.save(entry, label)
+        return entry
+    
+    def _apply_gallery_changes(self, entry, since, generation, settled=False):
+        """
+        Replay users changed after generation `since` onto entry
+        Returns the generation the result is consistent with. When every
+        published change has been stamped (settled) that is `generation`:
+        generations never read were overwritten by a later stamp on the same
+        user, which the replay did read. While a publish is still stamping,
+        only the unbroken run of observed generations is trusted, so a
+        change stamped out of order is fetched again next time.
+        """
+        changed = list(self.users.find({
+            'class_code': entry.class_code,
+            'gallery_generation': {'$gt': since}
+        }))
+        
+        self._attach_encodings([u for u in changed if u.get('is_active')], entry.class_code)
+        
+        for user in changed:
+            entry.remove_user(user['user_id'], entry.class_code)
+            if user.get('is_active'):
+                entry.add_user(user, user['face_encodings'])
+        
+        if settled:
+            return generation
+        
+        observed = {u['gallery_generation'] for u in changed}
+        label = since
+        while label + 1 in observed:
+            label += 1
+        if generation - label > Config.GALLERY_SNAPSHOT_MAX_GAP:
+            label = generation
+        return label
+    
+    def get_gallery_generation(self, class_code):
+        """Current gallery generation for a class (0 if it never changed)"""
+        return self._gallery_state(class_code)[0]
+    
+    def _gallery_state(self, class_code):
+        """(generation, settled): settled once no publish is still stamping users"""
+        meta = self.gallery_meta.find_one({'class_code': class_code}, {'generation': 1, 'in_flight': 1})
+        if not meta:
+            return 0, True
+        return meta.get('generation', 0), meta.get('in_flight', 0) <= 0
+    
+    def _publish_gallery_change(self, class_code, user_filter):
+        """Bump the class's gallery generation and stamp it on the changed users"""
+        meta = self.gallery_meta.find_one_and_update(
+            {'class_code': class_code},
+            {'$inc': {'generation': 1, 'in_flight': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        try:
+            self.users.update_many(user_filter, {'$set': {'gallery_generation': meta['generation']}})
+        finally:
+            self.gallery_meta.update_one({'class_code': class_code}, {'$inc': {'in_flight': -1}})
+        return meta['generation']
+    
+    def preload_galleries(self):
+        """Load every class that has a disk snapshot into the gallery cache"""
+        class_codes = snapshot_store.list_classes()
+        for class_code in class_codes:
+            self.get_class_gallery(class_code)
+        if class_codes:
+            print(f"✓ Preloaded {len(class_codes)} class galleries from snapshots")
+    
+    def get_face_index(self):
+        """
+        Get the campus-wide face index, building it from every class on first
+        use and reloading classes other processes have changed since
+        """
+        generations = {
+            meta['class_code']: meta.get('generation', 0)
+            for meta in self.gallery_meta.find({}, {'class_code': 1, 'generation': 1})
+        }
+        return campus_index.ensure_current(
+            generations,
+            self.get_all_users,
+            lambda class_code: self.get_all_users(class_code=class_code)
+        )
+    
     def mark_attendance(self, user_id, name, class_code=None):
-        """Mark attendance with class reference"""
+        """
+        Mark attendance with class reference
+        One atomic upsert against the unique (user_id, class_code, date)
+        index: it inserts today's record or returns the existing one, so
+        concurrent marks for the same student cannot both succeed.
+        """
         try:
-            today = datetime.now().date()
-            existing = self.attendance.find_one({
+            now = datetime.now()
+            today = str(now.date())
+            query = {
                 'user_id': user_id,
-                'date': str(today),
+                'date': today,
                 'class_code': class_code
-            })
-            
-            if existing:
-                return {'status': 'already_marked', 'time': existing['time']}
+            }
             
             attendance_data = {
                 'user_id': user_id,
                 'name': name,
                 'class_code': class_code,
-                'date': str(today),
-                'time': datetime.now().strftime('%H:%M:%S'),
-                'timestamp': datetime.now()
+                'date': today,
+                'time': now.strftime('%H:%M:%S'),
+                'timestamp': now,
+                'counted_in_rollup': True  # Added to attendance_daily below
             }
             
-            self.attendance.insert_one(attendance_data)
+            def write(session):
+                existing = self.attendance.find_one_and_update(
+                    query,
+                    {'$setOnInsert': attendance_data},
+                    projection={'time': 1},
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE,
+                    session=session
+                )
+                if existing is None:
+                    self._record_daily_marks(class_code, today, [attendance_data['time']], session)
+                return existing
+            
+            try:
+                existing = self._run_write(write)
+            except DuplicateKeyError:
+                # A concurrent upsert inserted first; report its record
+                existing = self.attendance.find_one(query, {'time': 1})
+            
+            if existing:
+                return {'status': 'already_marked', 'time': existing['time']}
+            
             return {'status': 'success', 'time': attendance_data['time']}
         except Exception as e:
             print(f"❌ Error marking attendance: {e}")
             return {'status': 'error', 'message': str(e)}
     
+    def mark_attendance_bulk(self, students, class_code=None, marked_at=None):
+        """
+        Mark attendance for many students with one bulk write
+        students: list of (user_id, name)
+        marked_at: datetime to record (defaults to now)
+        Returns: {user_id: {'status': 'success'|'already_marked', 'time': ...}}
+        """
+        try:
+            if not students:
+                return {}
+            
+            now = marked_at or datetime.now()
+            today = str(now.date())
+            time_str = now.strftime('%H:%M:%S')
+            
+            operations = [
+                UpdateOne(
+                    {'user_id': user_id, 'date': today, 'class_code': class_code},
+                    {'$setOnInsert': {
+                        'user_id': user_id,
+                        'name': name,
+                        'class_code': class_code,
+                        'date': today,
+                        'time': time_str,
+                        'timestamp': now,
+                        'counted_in_rollup': True
+                    }},
+                    upsert=True
+                )
+                for user_id, name in students
+            ]
+            def write(session):
+                try:
+                    upserted = self.attendance.bulk_write(operations, ordered=False, session=session).upserted_ids
+                except BulkWriteError as e:
+                    # Duplicate keys mean a concurrent mark won; anything else is
+                    # real. In a transaction the batch is aborted and retried below.
+                    if session is not None or not _only_duplicate_keys(e):
+                        raise
+                    upserted = {u['index']: u['_id'] for u in e.details.get('upserted', [])}
+                self._record_daily_marks(class_code, today, [time_str] * len(upserted), session)
+                return upserted
+            
+            for attempt in range(3):
+                try:
+                    upserted = self._run_write(write)
+                    break
+                except BulkWriteError as e:
+                    # The retry matches the concurrent marks instead of inserting
+                    if attempt == 2 or not _only_duplicate_keys(e):
+                        raise
+            
+            inserted = {students[i][0] for i in upserted}
+            results = {user_id: {'status': 'success', 'time': time_str} for user_id in inserted}
+            
+            # Fetch the original times of students who were already marked
+            existing = [user_id for user_id, _ in students if user_id not in inserted]
+            if existing:
+                for record in self.attendance.find(
+                    {'user_id': {'$in': existing}, 'date': today, 'class_code': class_code},
+                    {'user_id': 1, 'time': 1}
+                ):
+                    results[record['user_id']] = {'status': 'already_marked', 'time': record['time']}
+            
+            return results
+        except Exception as e:
+            print(f"❌ Error bulk marking attendance: {e}")
+            return {user_id: {'status': 'error', 'message': str(e)} for user_id, _ in students}
+    
+    def _record_daily_marks(self, class_code, date, times, session=None):
+        """
+        Add newly inserted marks to the class's attendance_daily rollup
+        Inside a transaction a failure aborts the marks with it. Without
+        one (standalone servers) the marks stand and the day has to be
+        recounted with `python manage_indexes.py rebuild-rollup --date`.
+        """
+        if not times:
+            return
+        late = sum(1 for t in times if t >= Config.LATE_ARRIVAL_TIME)
+        try:
+            self.attendance_daily.update_one(
+                {'class_code': class_code, 'date': date},
+                {'$inc': {'present': len(times), 'late': late}},
+                upsert=True,
+                session=session
+            )
+        except Exception as e:
+            if session is not None:
+                raise
+            print(f"⚠️ Could not update daily rollup for {class_code} on {date}: {e}. "
+                  f"Run `python manage_indexes.py rebuild-rollup --date {date}`")
+    
+    def _rollup_ready(self):
+        """True once the attendance_daily backfill migration has been applied"""
+        if not self._rollup_applied:
+            self._rollup_applied = self.db.schema_migrations.find_one(
+                {'_id': DAILY_ROLLUP_MIGRATION, 'status': 'applied'}, {'_id': 1}) is not None
+        return self._rollup_applied
+    
+    def count_users(self, class_code=None):
+        """Number of active users, optionally in one class"""
+        query = {'is_active': True}
+        if class_code:
+            query['class_code'] = class_code
+        return self.users.count_documents(query)
+    
+    def get_daily_stats(self, date, class_code=None):
+        """
+        Present and late counts for a day, optionally for one class
+        Read from the attendance_daily rollup once migration 3 has built it;
+        until then counted from the attendance records with one aggregation.
+        """
+        query = {'date': date}
+        if class_code:
+            query['class_code'] = class_code
+        
+        if self._rollup_ready():
+            rollups = list(self.attendance_daily.find(query, {'present': 1, 'late': 1}))
+        else:
+            rollups = list(self.attendance.aggregate([{'$match': query}, daily_rollup_group()]))
+        
+        return {
+            'present': sum(r.get('present', 0) for r in rollups),
+            'late': sum(r.get('late', 0) for r in rollups)
+        }
+    
     def get_attendance_by_date(self, date, class_code=None):
         """Get attendance records for specific date and class"""
         try:
             query = {'date': date}
             if class_code:
                 query['class_code'] = class_code
-            return list(self.attendance.find(query).sort('time', 1))
+            return list(self.attendance.find(query, {'counted_in_rollup': 0}).sort('time', 1))
         except Exception as e:
             print(f"❌ Error getting attendance: {e}")
             return []
@@ -153,17 +572,41 @@ class DatabaseManager:
             query = {}
             if class_code:
                 query['class_code'] = class_code
-            return list(self.attendance.find(query).sort('timestamp', -1).limit(100))
+            return list(self.attendance.find(query, {'counted_in_rollup': 0}).sort('timestamp', -1).limit(100))
         except Exception as e:
             print(f"❌ Error getting all attendance: {e}")
             return []
     
+    def iter_attendance(self, class_code=None, start_date=None, end_date=None):
+        """
+        Cursor over attendance records for export, newest day first
+        One range query on date, fetched EXPORT_BATCH_SIZE documents at a
+        time as the caller iterates, so memory stays bounded.
+        """
+        query = {}
+        if class_code:
+            query['class_code'] = class_code
+        if start_date or end_date:
+            query['date'] = {}
+            if start_date:
+                query['date']['$gte'] = start_date
+            if end_date:
+                query['date']['$lte'] = end_date
+        
+        return self.attendance.find(
+            query,
+            {'_id': 0, 'user_id': 1, 'name': 1, 'class_code': 1, 'date': 1, 'time': 1},
+            batch_size=Config.EXPORT_BATCH_SIZE
+        ).sort([('date', -1), ('time', 1)])
+    
     def delete_user(self, user_id, class_code=None):
         """Soft delete user from specific class"""
         try:
             query = {'user_id': user_id}
             if class_code:
                 query['class_code'] = class_code
+            
+            affected_classes = self.users.distinct('class_code', {**query, 'is_active': True})
                 
             result = self.users.update_one(
                 query,
@@ -175,6 +618,14 @@ class DatabaseManager:
             if class_code:
                 encoding_query['class_code'] = class_code
             self.face_encodings.delete_many(encoding_query)
+            published = {
+                affected_class: self._publish_gallery_change(affected_class, {'user_id': user_id, 'class_code': affected_class})
+                for affected_class in affected_classes
+            }
+            gallery_cache.remove_user(user_id, class_code)
+            campus_index.remove_user(user_id, class_code)
+            for affected_class, generation in published.items():
+                campus_index.mark_published(affected_class, generation)
             
             print(f"✓ User {user_id} deleted from {class_code if class_code else 'all classes'}")
             return result
@@ -185,16 +636,10 @@ class DatabaseManager:
     def get_class_statistics(self, class_code):
         """Get statistics for a specific class"""
         try:
-            total_students = self.users.count_documents({
-                'class_code': class_code,
-                'is_active': True
-            })
+            total_students = self.count_users(class_code)
             
             today = datetime.now().strftime('%Y-%m-%d')
-            today_attendance = self.attendance.count_documents({
-                'class_code': class_code,
-                'date': today
-            })
+            today_attendance = self.get_daily_stats(today, class_code)['present']
             
             return {
                 'total_students': total_students,
@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DetectorPool:
+    """
+    Bounded checkout pool of face detectors
+    cv2.dnn_Net keeps its input between setInput() and forward(), so one
+    net must never be used by two threads at once. Each request thread
+    checks a detector out, uses it, and returns it. Detectors are created
+    lazily up to `size`; beyond that callers wait for a free one.
+    """
+
+    def __init__(self, factory, size, initial=None):
+        self.factory = factory
+        self.size = max(1, int(size))
+
+        self._available = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+        for detector in (initial or [])[:self.size]:
+            self._available.put(detector)
+            self._created += 1
+
+        # Metrics
+        self._started_at = time.perf_counter()
+        self.checkouts = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.busy_time = 0.0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.timeouts = 0
+
+    def _acquire(self, timeout):
+        try:
+            return self._available.get_nowait(), False
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self.factory(), False
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._available.get(timeout=timeout), True
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"No face detector free after {timeout}s")
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Borrow a detector for the duration of the with-block"""
+        requested = time.perf_counter()
+        detector, waited = self._acquire(timeout)
+        acquired = time.perf_counter()
+        wait = acquired - requested
+
+        with self._lock:
+            self.checkouts += 1
+            self.waits += int(waited)
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+        try:
+            yield detector
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                self.busy_time += time.perf_counter() - acquired
+            self._available.put(detector)
+
+    def stats(self):
+        """Wait-time and utilization counters"""
+        with self._lock:
+            elapsed = time.perf_counter() - self._started_at
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'utilization': round(self.busy_time / (elapsed * self.size), 4) if elapsed > 0 else 0.0
+            }
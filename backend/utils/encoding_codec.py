@@ -0,0 +1,79 @@
+import numpy as np
+from bson.binary import Binary
+from config import Config
+
+# Bump when the on-disk layout of binary encodings changes
+ENCODING_FORMAT_VERSION = 1
+
+ENCODING_DTYPES = {
+    'float32': np.float32,
+    'float16': np.float16,
+    'int8': np.int8
+}
+
+
+def encode_encoding(encoding, storage_format=None):
+    """
+    Pack a face encoding into compact BSON fields
+    Returns a dict to merge into a face_encodings document:
+      encoding          BinData with little-endian values
+      encoding_format   'float32', 'float16' or 'int8'
+      encoding_version  ENCODING_FORMAT_VERSION
+      encoding_dim      number of values
+      encoding_scale    dequantization factor (int8 only)
+    """
+    storage_format = storage_format or Config.ENCODING_STORAGE_FORMAT
+    if storage_format not in ENCODING_DTYPES:
+        raise ValueError(f"Unknown encoding storage format: {storage_format}")
+
+    values = np.asarray(encoding, dtype=np.float32).ravel()
+    fields = {
+        'encoding_format': storage_format,
+        'encoding_version': ENCODING_FORMAT_VERSION,
+        'encoding_dim': int(values.size)
+    }
+
+    if storage_format == 'int8':
+        peak = float(np.abs(values).max()) if values.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        values = np.clip(np.rint(values / scale), -127, 127)
+        fields['encoding_scale'] = scale
+
+    dtype = np.dtype(ENCODING_DTYPES[storage_format]).newbyteorder('<')
+    fields['encoding'] = Binary(values.astype(dtype).tobytes())
+    return fields
+
+
+def decode_encoding(doc):
+    """
+    Read a face encoding from a face_encodings document as float32
+    float32 payloads are returned as a zero-copy read-only view of the
+    BSON bytes. Legacy documents store a plain list of doubles.
+    """
+    raw = doc['encoding']
+    storage_format = doc.get('encoding_format')
+
+    if storage_format is None:
+        return np.asarray(raw, dtype=np.float32)
+
+    if doc.get('encoding_version', 1) > ENCODING_FORMAT_VERSION:
+        raise ValueError(f"Unsupported encoding version: {doc.get('encoding_version')}")
+
+    dtype = np.dtype(ENCODING_DTYPES[storage_format]).newbyteorder('<')
+    values = np.frombuffer(raw, dtype=dtype)
+
+    if storage_format == 'int8':
+        return values.astype(np.float32) * np.float32(doc.get('encoding_scale', 1.0))
+    if storage_format == 'float16':
+        return values.astype(np.float32)
+    return values
+
+
+# Fields to project when reading encodings back
+ENCODING_PROJECTION = {
+    'encoding': 1,
+    'encoding_format': 1,
+    'encoding_version': 1,
+    'encoding_scale': 1,
+    '_id': 0
+}
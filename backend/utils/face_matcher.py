@@ -0,0 +1,200 @@
+import numpy as np
+from config import Config
+
+
+def normalize_encodings(encodings, dim=None, return_index=False):
+    """
+    Stack encodings into a float32 matrix with unit-length rows
+    Malformed rows (not numeric, not finite, or not `dim` wide, by default
+    the most common width) are skipped with a warning, as the original
+    per-encoding comparison did, instead of failing the whole gallery.
+    return_index=True also returns the input positions of the kept rows.
+    """
+    rows, positions = [], []
+    for position, enc in enumerate(encodings):
+        try:
+            row = np.asarray(enc, dtype=np.float32).ravel()
+        except (TypeError, ValueError):
+            continue
+        if len(row) and np.all(np.isfinite(row)):
+            rows.append(row)
+            positions.append(position)
+
+    if rows and not dim:
+        # Most common width; ties go to the wider (less likely truncated) one
+        widths, counts = np.unique([len(row) for row in rows], return_counts=True)
+        dim = int(max(zip(counts, widths))[1])
+    kept = [i for i, row in enumerate(rows) if len(row) == dim]
+
+    skipped = len(encodings) - len(kept)
+    if skipped:
+        print(f"⚠️ Skipped {skipped} malformed face encoding(s)")
+
+    if kept:
+        matrix = np.stack([rows[i] for i in kept])
+        matrix = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10)
+    else:
+        matrix = np.zeros((0, dim or 0), dtype=np.float32)
+
+    if return_index:
+        return matrix, np.array([positions[i] for i in kept], dtype=np.int64)
+    return matrix
+
+
+class MatchResult:
+    """Outcome of matching one probe encoding against a gallery"""
+
+    def __init__(self, user=None, user_index=None, row_index=None,
+                 similarity=None, distance=None, candidates=None):
+        self.user = user
+        self.user_index = user_index
+        self.row_index = row_index
+        self.similarity = similarity
+        self.distance = distance
+        self.candidates = candidates or []
+
+    @property
+    def matched(self):
+        return self.user is not None
+
+
+class FaceMatcher:
+    """
+    Vectorized face matcher
+    Scores a probe against every encoding of a gallery with a single
+    matrix-vector product. Acceptance follows FaceUtils.compare_faces:
+    the best cosine similarity must be strictly greater than the tolerance
+    and distance is reported as 1 - similarity.
+    """
+
+    def __init__(self, tolerance=None):
+        self.tolerance = tolerance if tolerance is not None else Config.FACE_RECOGNITION_TOLERANCE
+
+    @staticmethod
+    def normalize_probe(face_encoding, dim):
+        """L2-normalized probe, or None if it is not `dim` wide"""
+        probe = normalize_encodings([face_encoding], dim)
+        return probe[0] if len(probe) else None
+
+    def score(self, matrix, face_encoding):
+        """
+        Cosine similarity of the probe against every row of matrix
+        A probe of a different width than the gallery scores nothing.
+        """
+        if len(matrix) == 0:
+            return np.zeros(0, dtype=np.float32)
+        probe = self.normalize_probe(face_encoding, matrix.shape[1])
+        if probe is None:
+            return np.zeros(0, dtype=np.float32)
+        return matrix @ probe
+
+    @staticmethod
+    def per_user_scores(similarities, owners):
+        """
+        Reduce row similarities to per-user max and mean
+        Relies on each user's rows being contiguous in the gallery.
+        Returns: (user_indices, max_similarity, mean_similarity)
+        """
+        if len(similarities) == 0:
+            empty = np.zeros(0, dtype=np.float32)
+            return np.zeros(0, dtype=np.int32), empty, empty
+
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        counts = np.diff(np.r_[starts, len(owners)])
+        max_sim = np.maximum.reduceat(similarities, starts)
+        mean_sim = np.add.reduceat(similarities, starts) / counts
+        return owners[starts], max_sim, mean_sim
+
+    def match(self, gallery, face_encoding, top_k=0, tolerance=None):
+        """
+        Find the best matching user for a probe encoding
+        gallery: GalleryEntry
+        top_k: number of per-user candidates to report (0 disables)
+        """
+        if tolerance is None:
+            tolerance = self.tolerance
+
+        similarities = self.score(gallery.matrix, face_encoding)
+        if len(similarities) == 0:
+            return MatchResult()
+
+        candidates = []
+        if top_k:
+            user_indices, max_sim, mean_sim = self.per_user_scores(similarities, gallery.owners)
+            order = np.argsort(-max_sim, kind='stable')[:top_k]
+            for i in order:
+                user = gallery.users[user_indices[i]]
+                candidates.append({
+                    'user_id': user.get('user_id'),
+                    'name': user.get('name'),
+                    'max_similarity': float(max_sim[i]),
+                    'mean_similarity': float(mean_sim[i]),
+                    'distance': float(1 - max_sim[i])
+                })
+
+        best_row = int(np.argmax(similarities))
+        best_similarity = float(similarities[best_row])
+
+        if best_similarity <= tolerance:
+            return MatchResult(candidates=candidates)
+
+        user_index = int(gallery.owners[best_row])
+        return MatchResult(
+            user=gallery.users[user_index],
+            user_index=user_index,
+            row_index=best_row,
+            similarity=best_similarity,
+            distance=1 - best_similarity,
+            candidates=candidates
+        )
+
+    def match_many(self, gallery, face_encodings, tolerance=None):
+        """
+        Match several probes at once with one-to-one assignment
+        All probes are scored against the gallery in a single matrix
+        product and reduced to per-user best similarities. Pairs above the
+        tolerance are then assigned greedily, highest similarity first, so
+        no user is matched to two faces and no face to two users.
+        Returns: list of MatchResult, one per probe (unmatched probes empty)
+        """
+        if tolerance is None:
+            tolerance = self.tolerance
+
+        results = [MatchResult() for _ in face_encodings]
+        if len(face_encodings) == 0 or len(gallery.matrix) == 0:
+            return results
+
+        # Probes of the wrong width are left unmatched
+        probes, probe_positions = normalize_encodings(face_encodings, gallery.matrix.shape[1], return_index=True)
+        if len(probes) == 0:
+            return results
+        similarities = probes @ gallery.matrix.T
+
+        # Per-user best row for every probe (rows of a user are contiguous)
+        starts = np.flatnonzero(np.r_[True, gallery.owners[1:] != gallery.owners[:-1]])
+        user_sim = np.maximum.reduceat(similarities, starts, axis=1)
+        user_indices = gallery.owners[starts]
+
+        probe_order, user_order = np.nonzero(user_sim > tolerance)
+        order = np.argsort(-user_sim[probe_order, user_order], kind='stable')
+
+        used_probes, used_users = set(), set()
+        for i in order:
+            p, u = int(probe_order[i]), int(user_order[i])
+            if p in used_probes or u in used_users:
+                continue
+            used_probes.add(p)
+            used_users.add(u)
+
+            user_index = int(user_indices[u])
+            rows = np.arange(starts[u], starts[u + 1] if u + 1 < len(starts) else len(gallery.owners))
+            best_row = int(rows[np.argmax(similarities[p, rows])])
+            similarity = float(user_sim[p, u])
+            results[int(probe_positions[p])] = MatchResult(
+                user=gallery.users[user_index],
+                user_index=user_index,
+                row_index=best_row,
+                similarity=similarity,
+                distance=1 - similarity
+            )
+        return results
@@ -2,42 +2,87 @@ import cv2
 import numpy as np
 import os
 from config import Config
-import urllib.request
+from utils.face_matcher import FaceMatcher, normalize_encodings
+from utils.detector_pool import DetectorPool
+from contextlib import ExitStack
+
+
+face_matcher = FaceMatcher()
+
+# Histogram layout of the 128-d encoding
+ENCODING_BINS = 128
+ENCODING_RANGE = (-3.0, 3.0)
+
+# Detections below this confidence are dropped unless a caller asks otherwise
+DETECTION_MIN_CONFIDENCE = 0.5
+
+
+class FaceAnalysis:
+    """Everything one detector pass produces for an image"""
+    
+    def __init__(self, boxes, confidences, face=None, encoding=None):
+        self.boxes = boxes              # (startX, startY, endX, endY) per detection
+        self.confidences = confidences
+        self.face = face                # best face crop, 160x160
+        self.encoding = encoding
+    
+    @property
+    def has_face(self):
+        return len(self.boxes) > 0
+    
+    @property
+    def best_box(self):
+        if not self.boxes:
+            return None
+        return self.boxes[int(np.argmax(self.confidences))]
+
+
+class DetectedFace:
+    """One face found in a (possibly multi-face) photo"""
+    
+    def __init__(self, image_index, box, confidence, face=None, encoding=None):
+        self.image_index = image_index  # Index of the source photo
+        self.box = box                  # (startX, startY, endX, endY)
+        self.confidence = confidence
+        self.face = face                # 160x160 crop
+        self.encoding = encoding
 
 
 class FaceUtils:
-    def __init__(self):
+    def __init__(self, prototxt_path=None, caffemodel_path=None, use_dnn=True):
+        """
+        Prefer utils.model_registry.get_face_utils(), which shares one
+        instance per process and verifies the weights' checksums.
+        """
         # Load Deep Learning face detector
-        self.face_net = self.load_face_detector()
+        self._model_paths = None
+        self.face_net = self.load_face_detector(prototxt_path, caffemodel_path, use_dnn)
+        
+        # setInput()/forward() is stateful, so concurrent requests each
+        # check out their own detector; extras are created on demand
+        self.detector_pool = DetectorPool(
+            self._create_detector,
+            Config.DETECTOR_POOL_SIZE,
+            initial=[self.face_net]
+        )
     
-    def load_face_detector(self):
+    def load_face_detector(self, prototxt_path=None, caffemodel_path=None, use_dnn=True):
         """Load OpenCV DNN face detector (Deep Learning - SSD with ResNet-10)"""
         try:
-            model_dir = os.path.join(Config.BASE_DIR, 'models')
-            os.makedirs(model_dir, exist_ok=True)
-            
-            prototxt_path = os.path.join(model_dir, 'deploy.prototxt')
-            caffemodel_path = os.path.join(model_dir, 'res10_300x300_ssd_iter_140000.caffemodel')
-            
-            # Download models if not present
-            if not os.path.exists(prototxt_path):
-                print("Downloading face detection model (prototxt)...")
-                urllib.request.urlretrieve(
-                    'https://raw.githubusercontent.com/opencv/opencv/master/samples/dnn/face_detector/deploy.prototxt',
-                    prototxt_path
-                )
-                print("✓ Prototxt downloaded")
-            
-            if not os.path.exists(caffemodel_path):
-                print("Downloading face detection model (caffemodel - may take a minute)...")
-                urllib.request.urlretrieve(
-                    'https://raw.githubusercontent.com/opencv/opencv_3rdparty/dnn_samples_face_detector_20170830/res10_300x300_ssd_iter_140000.caffemodel',
-                    caffemodel_path
-                )
-                print("✓ Caffemodel downloaded")
+            if not use_dnn:
+                raise RuntimeError("DNN model disabled")
+            
+            prototxt_path = prototxt_path or Config.FACE_DETECTOR_PROTOTXT
+            caffemodel_path = caffemodel_path or Config.FACE_DETECTOR_WEIGHTS
+            
+            # Weights must be bundled or configured locally, never downloaded
+            for path in (prototxt_path, caffemodel_path):
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"{path} not found")
             
             # Load Deep Learning model
             net = cv2.dnn.readNetFromCaffe(prototxt_path, caffemodel_path)
+            self._model_paths = (prototxt_path, caffemodel_path)
             print("✓ Deep Learning face detector (SSD ResNet-10) loaded successfully!")
             return net
             
@@ -48,96 +93,258 @@ class FaceUtils:
                 cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
             )
     
-    def detect_face(self, image):
-        """Detect faces using Deep Learning"""
-        try:
-            if isinstance(self.face_net, cv2.dnn_Net):
-                # Deep Learning detection
+    def warm_up(self, detectors=1):
+        """Run a dummy frame through `detectors` pooled detectors"""
+        dummy = np.zeros((480, 640, 3), dtype=np.uint8)
+        count = max(1, min(detectors, self.detector_pool.size))
+        with ExitStack() as stack:
+            nets = [
+                stack.enter_context(self.detector_pool.checkout(Config.DETECTOR_POOL_TIMEOUT_SECONDS))
+                for _ in range(count)
+            ]
+            for net in nets:
+                if isinstance(net, cv2.dnn_Net):
+                    self._run_dnn_batches(net, [dummy])
+    
+    def _create_detector(self):
+        """Create another detector of the same kind as self.face_net"""
+        if self._model_paths is not None:
+            return cv2.dnn.readNetFromCaffe(*self._model_paths)
+        return cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+    
+    def _run_detector(self, image):
+        """
+        Run the face detector once
+        Returns: (boxes, confidences) with boxes as (startX, startY, endX, endY)
+        """
+        return self._run_detector_batch([image])[0]
+    
+    def _run_detector_batch(self, images, max_batch_size=None, min_confidence=DETECTION_MIN_CONFIDENCE):
+        """
+        Run the face detector over several images
+        DNN frames are stacked into N x 3 x 300 x 300 blobs of at most
+        max_batch_size images, one forward() per blob.
+        Returns: list of (boxes, confidences), one per input image
+        """
+        with self.detector_pool.checkout(Config.DETECTOR_POOL_TIMEOUT_SECONDS) as detector:
+            if not isinstance(detector, cv2.dnn_Net):
+                # Fallback to Haar Cascade, one image at a time
+                results = []
+                for image in images:
+                    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                    faces = detector.detectMultiScale(gray, 1.1, 5, minSize=(50, 50))
+                    boxes = [np.array([x, y, x + fw, y + fh]) for (x, y, fw, fh) in faces]
+                    results.append((boxes, [1.0] * len(boxes)))
+                return results
+            
+            return self._run_dnn_batches(detector, images, max_batch_size, min_confidence)
+    
+    def _run_dnn_batches(self, net, images, max_batch_size=None, min_confidence=DETECTION_MIN_CONFIDENCE):
+        """Forward images through a checked-out DNN in blobs of max_batch_size"""
+        max_batch_size = max_batch_size or Config.FACE_DETECTOR_MAX_BATCH_SIZE
+        results = []
+        
+        for start in range(0, len(images), max_batch_size):
+            chunk = images[start:start + max_batch_size]
+            
+            # Deep Learning detection
+            blob = cv2.dnn.blobFromImages(
+                [cv2.resize(image, (300, 300)) for image in chunk],
+                1.0,
+                (300, 300),
+                (104.0, 177.0, 123.0)
+            )
+            
+            net.setInput(blob)
+            detections = net.forward()[0, 0]
+            
+            # Column 0 is the index of the source image within the blob
+            detections = detections[detections[:, 2] > min_confidence]
+            
+            for batch_index, image in enumerate(chunk):
                 (h, w) = image.shape[:2]
-                blob = cv2.dnn.blobFromImage(
-                    cv2.resize(image, (300, 300)), 
-                    1.0,
-                    (300, 300), 
-                    (104.0, 177.0, 123.0)
-                )
-                
-                self.face_net.setInput(blob)
-                detections = self.face_net.forward()
-                
-                for i in range(0, detections.shape[2]):
-                    confidence = detections[0, 0, i, 2]
-                    if confidence > 0.5:
-                        return True
-                return False
-            else:
-                # Fallback to Haar Cascade
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                faces = self.face_net.detectMultiScale(gray, 1.1, 5, minSize=(50, 50))
-                return len(faces) > 0
-                
+                own = detections[detections[:, 0].astype(int) == batch_index]
+                boxes = [
+                    (det[3:7] * np.array([w, h, w, h])).astype("int")
+                    for det in own
+                ]
+                results.append((boxes, [float(det[2]) for det in own]))
+        
+        return results
+    
+    def _crop_face(self, image, boxes, confidences):
+        """Crop the best detection and resize it to 160x160"""
+        if not boxes:
+            return None
+        
+        (h, w) = image.shape[:2]
+        
+        if isinstance(self.face_net, cv2.dnn_Net):
+            best = int(np.argmax(confidences))
+            (startX, startY, endX, endY) = boxes[best]
+            # Add padding and boundary checks
+            startX = max(0, startX)
+            startY = max(0, startY)
+            endX = min(w, endX)
+            endY = min(h, endY)
+            
+            face = image[startY:endY, startX:endX]
+            if face.size > 0:
+                return cv2.resize(face, (160, 160))
+            return None
+        
+        # Haar Cascade crops the first face from the grayscale frame
+        (startX, startY, endX, endY) = boxes[0]
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray[startY:endY, startX:endX], (160, 160))
+    
+    def analyze(self, image, encode=True):
+        """
+        Detect, crop and encode a face with a single detector pass
+        Returns: FaceAnalysis
+        """
+        try:
+            boxes, confidences = self._run_detector(image)
+            face = self._crop_face(image, boxes, confidences)
+            encoding = self.encode_face(face) if encode and face is not None else None
+            return FaceAnalysis(boxes, confidences, face, encoding)
         except Exception as e:
-            print(f"Error detecting face: {e}")
-            return False
+            print(f"Error analyzing face: {e}")
+            return FaceAnalysis([], [])
     
-    def extract_face_region(self, image):
-        """Extract face region using Deep Learning"""
+    def analyze_batch(self, images, encode=True, max_batch_size=None):
+        """
+        Analyze several images with batched detector passes
+        Returns: list of FaceAnalysis in input order
+        """
         try:
-            if isinstance(self.face_net, cv2.dnn_Net):
-                (h, w) = image.shape[:2]
-                blob = cv2.dnn.blobFromImage(
-                    cv2.resize(image, (300, 300)), 
-                    1.0,
-                    (300, 300), 
-                    (104.0, 177.0, 123.0)
-                )
-                
-                self.face_net.setInput(blob)
-                detections = self.face_net.forward()
-                
-                best_confidence = 0
-                best_box = None
-                
-                for i in range(0, detections.shape[2]):
-                    confidence = detections[0, 0, i, 2]
-                    if confidence > best_confidence and confidence > 0.5:
-                        best_confidence = confidence
-                        box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                        best_box = box.astype("int")
-                
-                if best_box is not None:
-                    (startX, startY, endX, endY) = best_box
-                    # Add padding and boundary checks
-                    startX = max(0, startX)
-                    startY = max(0, startY)
-                    endX = min(w, endX)
-                    endY = min(h, endY)
-                    
-                    face = image[startY:endY, startX:endX]
-                    if face.size > 0:
-                        face = cv2.resize(face, (160, 160))
-                        return face
-                return None
-            else:
-                # Fallback to Haar Cascade
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                faces = self.face_net.detectMultiScale(gray, 1.1, 5, minSize=(50, 50))
-                if len(faces) > 0:
-                    (x, y, w, h) = faces[0]
-                    face = gray[y:y+h, x:x+w]
-                    return cv2.resize(face, (160, 160))
-                return None
-                
+            detections = self._run_detector_batch(images, max_batch_size)
         except Exception as e:
-            print(f"Error extracting face: {e}")
-            return None
+            print(f"Error analyzing faces: {e}")
+            return [FaceAnalysis([], []) for _ in images]
+        
+        analyses = []
+        for image, (boxes, confidences) in zip(images, detections):
+            try:
+                face = self._crop_face(image, boxes, confidences)
+                analyses.append(FaceAnalysis(boxes, confidences, face))
+            except Exception as e:
+                print(f"Error analyzing face: {e}")
+                analyses.append(FaceAnalysis([], []))
+        
+        # Encode every crop in one pass
+        if encode:
+            encoded = [a for a in analyses if a.face is not None]
+            try:
+                for analysis, encoding in zip(encoded, self.generate_encodings([a.face for a in encoded])):
+                    analysis.encoding = encoding
+            except Exception as e:
+                print(f"Error generating encodings: {e}")
+        return analyses
     
-    def generate_encoding(self, image):
-        """Generate compact face embedding (128 dimensions)"""
+    def _tile_boxes(self, image, tile_size):
+        """
+        Overlapping tile windows covering an image
+        Wide classroom photos are split so faces are not shrunk below what
+        the 300x300 detector input can resolve. The full frame is included
+        as its own tile for faces close to the camera.
+        """
+        (h, w) = image.shape[:2]
+        windows = [(0, 0, w, h)]
+        # Haar Cascade already scans every scale of the full frame
+        if max(h, w) <= tile_size or not isinstance(self.face_net, cv2.dnn_Net):
+            return windows
+        
+        stride = int(tile_size * (1 - Config.GROUP_TILE_OVERLAP))
+        xs = list(range(0, max(1, w - tile_size), stride)) + [max(0, w - tile_size)]
+        ys = list(range(0, max(1, h - tile_size), stride)) + [max(0, h - tile_size)]
+        for y in sorted(set(ys)):
+            for x in sorted(set(xs)):
+                windows.append((x, y, min(w, x + tile_size), min(h, y + tile_size)))
+        return windows
+    
+    def detect_all_faces(self, images, min_confidence=None, tile_size=None):
+        """
+        Detect every face in one or more photos
+        All tiles of all photos go through the detector in batched passes;
+        overlapping detections from neighbouring tiles are merged with NMS.
+        Returns: list of (boxes, confidences), one per image
+        """
+        if min_confidence is None:
+            min_confidence = Config.GROUP_MIN_FACE_CONFIDENCE
+        tile_size = tile_size or Config.GROUP_TILE_SIZE
+        
+        tiles, owners = [], []
+        for image_index, image in enumerate(images):
+            for window in self._tile_boxes(image, tile_size):
+                (x0, y0, x1, y1) = window
+                tiles.append(image[y0:y1, x0:x1])
+                owners.append((image_index, x0, y0))
+        
+        detections = self._run_detector_batch(tiles, min_confidence=min_confidence)
+        
+        per_image = [([], []) for _ in images]
+        for (image_index, x0, y0), (boxes, confidences) in zip(owners, detections):
+            for box, confidence in zip(boxes, confidences):
+                if confidence < min_confidence:
+                    continue
+                per_image[image_index][0].append(box + np.array([x0, y0, x0, y0]))
+                per_image[image_index][1].append(confidence)
+        
+        results = []
+        for boxes, confidences in per_image:
+            if not boxes:
+                results.append(([], []))
+                continue
+            rects = [[int(b[0]), int(b[1]), int(b[2] - b[0]), int(b[3] - b[1])] for b in boxes]
+            keep = cv2.dnn.NMSBoxes(rects, confidences, min_confidence, Config.GROUP_NMS_THRESHOLD)
+            keep = np.array(keep).ravel().astype(int)
+            results.append(([boxes[i] for i in keep], [confidences[i] for i in keep]))
+        return results
+    
+    def analyze_group(self, images, min_confidence=None):
+        """
+        Detect, crop and encode every face in one or more photos
+        Returns: list of DetectedFace across all images
+        """
+        faces = []
+        try:
+            detections = self.detect_all_faces(images, min_confidence)
+        except Exception as e:
+            print(f"Error detecting faces: {e}")
+            return faces
+        
+        for image_index, (image, (boxes, confidences)) in enumerate(zip(images, detections)):
+            (h, w) = image.shape[:2]
+            for box, confidence in zip(boxes, confidences):
+                (startX, startY, endX, endY) = box
+                crop = image[max(0, startY):min(h, endY), max(0, startX):min(w, endX)]
+                if crop.size == 0:
+                    continue
+                faces.append(DetectedFace(image_index, box, confidence, cv2.resize(crop, (160, 160))))
+        
+        # Encode every face in one pass
+        try:
+            for face, encoding in zip(faces, self.generate_encodings([f.face for f in faces])):
+                face.encoding = encoding
+        except Exception as e:
+            print(f"Error generating encodings: {e}")
+            return []
+        return faces
+    
+    def detect_face(self, image):
+        """Detect faces using Deep Learning"""
+        return self.analyze(image, encode=False).has_face
+    
+    def extract_face_region(self, image):
+        """Extract face region using Deep Learning"""
+        return self.analyze(image, encode=False).face
+    
+    def encode_face(self, face):
+        """Generate compact face embedding (128 dimensions) from a face crop"""
         try:
-            face = self.extract_face_region(image)
-            if face is None:
-                return None
-            
             # Convert to grayscale if needed
             if len(face.shape) == 3:
                 gray_face = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
@@ -151,7 +358,7 @@ class FaceUtils:
                 gray_face = (gray_face - mean) / std
             
             # Generate compact 128-dimensional feature vector
-            hist = cv2.calcHist([gray_face], [0], None, [128], [-3, 3])
+            hist = cv2.calcHist([gray_face], [0], None, [ENCODING_BINS], list(ENCODING_RANGE))
             hist = cv2.normalize(hist, hist).flatten()
             
             return hist.tolist()
@@ -160,41 +367,94 @@ class FaceUtils:
             print(f"Error generating encoding: {e}")
             return None
     
+    def generate_encodings(self, crops):
+        """
+        Encode a stack of face crops at once
+        Gives the same values as encode_face, row for row. Each 8-bit crop
+        only has 256 possible pixel values. So one bincount gives every
+        crop's value counts, each crop's mean/std normalization is applied
+        to those 256 values, and the counts are binned into the 128-bin
+        histograms with a second bincount.
+        Returns: N x 128 float32 array (zero rows for crops that fail)
+        """
+        encodings = np.zeros((len(crops), ENCODING_BINS), dtype=np.float32)
+        
+        groups = {}
+        for i, face in enumerate(crops):
+            if face is None:
+                continue
+            gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY) if len(face.shape) == 3 else face
+            if gray.dtype != np.uint8:
+                # Only 8-bit crops can use the lookup; encode the rest singly
+                encoding = self.encode_face(gray)
+                if encoding is not None:
+                    encodings[i] = encoding
+                continue
+            groups.setdefault(gray.shape, []).append((i, gray))
+        
+        scale = ENCODING_BINS / (ENCODING_RANGE[1] - ENCODING_RANGE[0])
+        offset = -ENCODING_RANGE[0] * scale
+        levels = np.arange(256, dtype=np.float64)
+        
+        for members in groups.values():
+            index = np.array([i for i, _ in members])
+            pixels = np.stack([gray for _, gray in members]).reshape(len(members), -1)
+            n, size = pixels.shape
+            
+            # Count of each pixel value, per crop
+            rows = np.arange(n, dtype=np.int64)[:, None]
+            counts = np.bincount((pixels + rows * 256).ravel(), minlength=n * 256).reshape(n, 256)
+            
+            # Per-crop mean/std from the counts
+            mean = counts @ levels / size
+            std = np.sqrt(np.maximum(counts @ (levels * levels) / size - mean * mean, 0))
+            mean = mean.astype(np.float32)[:, None]
+            std = std.astype(np.float32)[:, None]
+            
+            # Normalized value of each pixel level, then its histogram bin
+            values = np.broadcast_to(levels.astype(np.float32), (n, 256))
+            normalized = np.where(std > 0, (values - mean) / np.where(std > 0, std, 1), values)
+            bins = np.floor(normalized.astype(np.float64) * scale + offset)
+            valid = (bins >= 0) & (bins < ENCODING_BINS) & (counts > 0)
+            
+            flat = (np.broadcast_to(rows, bins.shape)[valid] * ENCODING_BINS +
+                    bins[valid].astype(np.int64))
+            hist = np.bincount(flat, weights=counts[valid],
+                               minlength=n * ENCODING_BINS).reshape(n, ENCODING_BINS)
+            
+            # L2 normalize like cv2.normalize (all-zero histograms stay zero)
+            norms = np.linalg.norm(hist, axis=1, keepdims=True)
+            hist = np.where(norms > np.finfo(np.float64).eps, hist / np.where(norms > 0, norms, 1), 0)
+            encodings[index] = hist
+        
+        return encodings
+    
+    def generate_encoding(self, image):
+        """Generate compact face embedding (128 dimensions)"""
+        return self.analyze(image).encoding
+    
     def compare_faces(self, known_encodings, face_encoding, tolerance=None):
         """Compare face encodings using cosine similarity"""
         if tolerance is None:
             tolerance = Config.FACE_RECOGNITION_TOLERANCE
         
-        best_match_index = None
-        best_similarity = -1
+        try:
+            # Score every known encoding in one matrix-vector product;
+            # malformed ones are skipped, positions map back to the input
+            known, positions = normalize_encodings(known_encodings, return_index=True)
+            similarities = face_matcher.score(known, face_encoding)
+        except Exception as e:
+            print(f"Error comparing faces: {e}")
+            return None, None
         
-        face_enc = np.array(face_encoding, dtype=np.float32)
+        if len(similarities) == 0:
+            return None, None
         
-        for idx, known_enc in enumerate(known_encodings):
-            try:
-                known = np.array(known_enc, dtype=np.float32)
-                
-                # Ensure same length
-                min_len = min(len(face_enc), len(known))
-                face_enc_norm = face_enc[:min_len]
-                known_norm = known[:min_len]
-                
-                # Normalize vectors
-                face_norm = face_enc_norm / (np.linalg.norm(face_enc_norm) + 1e-10)
-                known_norm_vec = known_norm / (np.linalg.norm(known_norm) + 1e-10)
-                
-                # Cosine similarity
-                similarity = np.dot(face_norm, known_norm_vec)
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match_index = idx
-                    
-            except Exception as e:
-                print(f"Error comparing face {idx}: {e}")
-                continue
+        best_row = int(np.argmax(similarities))
+        best_match_index = int(positions[best_row])
+        best_similarity = float(similarities[best_row])
         
-        if best_match_index is not None and best_similarity > tolerance:
+        if best_similarity > tolerance:
             distance = 1 - best_similarity
             return best_match_index, distance
         
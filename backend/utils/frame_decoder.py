@@ -0,0 +1,152 @@
+import base64
+import binascii
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import Config
+
+
+def request_fields(req):
+    """Non-file fields of a JSON or multipart request as a dict"""
+    if req.files or req.form:
+        return req.form.to_dict()
+    return req.get_json(silent=True) or {}
+
+
+def request_frames(req, field='images', single_field='image'):
+    """
+    Encoded frames sent with a request, in upload order
+    Multipart requests carry raw JPEG/PNG parts under `field` (or one
+    under `single_field`); a bare image/* body is a single frame. JSON
+    requests carry base64 data URLs, as older clients send them.
+    """
+    if req.files:
+        parts = req.files.getlist(field) or req.files.getlist(single_field)
+        return [part.read() for part in parts]
+
+    if req.mimetype and req.mimetype.startswith('image/'):
+        return [req.get_data()]
+
+    data = req.get_json(silent=True) or {}
+    for name in (field, single_field):
+        value = data.get(name)
+        if not value:
+            continue
+        # A lone data URL is one frame, not a sequence of characters
+        if isinstance(value, (str, bytes)):
+            return [value]
+        if isinstance(value, (list, tuple)):
+            return list(value)
+    return []
+
+
+def _frame_bytes(payload):
+    """Raw encoded bytes of a frame payload"""
+    if isinstance(payload, str):
+        _, _, encoded = payload.rpartition(',')
+        return base64.b64decode(encoded)
+    return payload
+
+
+def frame_size(buffer):
+    """(width, height) read from the image header, without decoding pixels"""
+    try:
+        with Image.open(io.BytesIO(buffer)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def reduced_read_flag(size, target_width):
+    """
+    Largest IMREAD_REDUCED_COLOR_* scale that keeps the frame at least
+    target_width wide, or IMREAD_COLOR for full resolution
+    """
+    if not target_width or size is None:
+        return cv2.IMREAD_COLOR
+
+    width = size[0]
+    if width >= 4 * target_width:
+        return cv2.IMREAD_REDUCED_COLOR_4
+    if width >= 2 * target_width:
+        return cv2.IMREAD_REDUCED_COLOR_2
+    return cv2.IMREAD_COLOR
+
+
+# Fraction of full resolution each read flag decodes at
+READ_SCALES = {
+    cv2.IMREAD_REDUCED_COLOR_4: 0.25,
+    cv2.IMREAD_REDUCED_COLOR_2: 0.5,
+}
+
+
+def decode_frame(payload, target_width=None, with_scale=False):
+    """
+    Decode one frame into a BGR image, returns None if it cannot be read
+    `payload` is raw encoded bytes (bytes, bytearray or memoryview) or a
+    base64 string with or without a data URL prefix. Raw bytes are wrapped
+    with np.frombuffer and handed to OpenCV without copying. With
+    target_width, JPEGs are decoded at 1/2 or 1/4 scale straight from the
+    DCT coefficients when the frame is at least that much wider.
+    with_scale returns (image, scale) instead, scale being the fraction of
+    full resolution decoded, so detectors can scale their minimum sizes.
+    """
+    image, flags = None, cv2.IMREAD_COLOR
+    try:
+        buffer = _frame_bytes(payload)
+        if len(buffer):
+            if target_width:
+                flags = reduced_read_flag(frame_size(buffer), target_width)
+            image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), flags)
+    except (binascii.Error, TypeError, ValueError, cv2.error) as e:
+        print(f"⚠️ Could not decode frame: {e}")
+
+    if with_scale:
+        return image, READ_SCALES.get(flags, 1.0)
+    return image
+
+
+def iter_frames(payloads, target_width=None, with_scale=False):
+    """
+    Decode frames on the shared thread pool, yielding them in upload order
+    cv2.imdecode releases the GIL, so frames decode in parallel. At most
+    FRAME_DECODE_WORKERS frames are queued ahead of the caller; the next one
+    is submitted as each is consumed, and any still queued are cancelled if
+    the caller stops iterating early.
+    """
+    if len(payloads) <= 1:
+        for payload in payloads:
+            yield decode_frame(payload, target_width, with_scale)
+        return
+
+    remaining = iter(payloads)
+    window = deque(
+        _decode_pool.submit(decode_frame, payload, target_width, with_scale)
+        for payload in islice(remaining, Config.FRAME_DECODE_WORKERS)
+    )
+    try:
+        while window:
+            frame = window.popleft().result()
+            for payload in islice(remaining, 1):
+                window.append(_decode_pool.submit(decode_frame, payload, target_width, with_scale))
+            yield frame
+    finally:
+        for future in window:
+            future.cancel()
+
+
+def decode_frames(payloads, target_width=None, with_scale=False):
+    """Decode all frames in parallel; undecodable frames come back as None"""
+    return list(iter_frames(payloads, target_width, with_scale))
+
+
+_decode_pool = ThreadPoolExecutor(
+    max_workers=Config.FRAME_DECODE_WORKERS,
+    thread_name_prefix='frame-decode'
+)
@@ -0,0 +1,236 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from config import Config
+from utils.face_matcher import normalize_encodings
+
+
+class GalleryEntry:
+    """
+    Face gallery for one class
+    Holds the class's users and a pre-stacked, L2-normalized float32
+    encoding matrix. Rows belonging to the same user are contiguous and
+    owners[row] is the index of that user in self.users.
+    """
+
+    def __init__(self, class_code, users):
+        self.class_code = class_code
+        self.users = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.owners = np.zeros(0, dtype=np.int32)
+        self.loaded_at = time.time()
+
+        for user in users:
+            self.add_user(user, user.get('face_encodings', []))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Wrap a GallerySnapshot without copying its memory-mapped arrays"""
+        entry = cls(snapshot.class_code, [])
+        entry.users = list(snapshot.users)
+        entry.matrix = snapshot.matrix
+        entry.owners = snapshot.owners
+        return entry
+
+    def add_user(self, user, encodings):
+        """Append a user and their encodings to the gallery"""
+        user = {k: v for k, v in user.items() if k != 'face_encodings'}
+        # Rows of a different width than the gallery are rejected
+        rows = normalize_encodings(encodings, self.matrix.shape[1] if len(self.matrix) else None)
+
+        user_index = len(self.users)
+        self.users.append(user)
+        if len(rows):
+            self.matrix = rows if not len(self.matrix) else np.vstack([self.matrix, rows])
+            self.owners = np.concatenate([
+                self.owners,
+                np.full(len(rows), user_index, dtype=np.int32)
+            ])
+
+    def remove_user(self, user_id, class_code=None):
+        """Drop a user and their rows, returns True if anything was removed"""
+        keep = [
+            i for i, u in enumerate(self.users)
+            if u.get('user_id') != user_id
+            or (class_code is not None and u.get('class_code') != class_code)
+        ]
+        if len(keep) == len(self.users):
+            return False
+
+        remap = np.full(len(self.users), -1, dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+
+        row_mask = remap[self.owners] >= 0
+        self.matrix = self.matrix[row_mask]
+        self.owners = remap[self.owners[row_mask]]
+        self.users = [self.users[i] for i in keep]
+        return True
+
+    def encodings_for(self, user_index):
+        """Normalized encoding rows for the user at user_index"""
+        return self.matrix[self.owners == user_index]
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.owners.nbytes
+
+
+class GalleryCache:
+    """
+    Process-wide cache of per-class face galleries
+    Avoids re-reading every user and encoding from MongoDB on each
+    recognition request. Entries are updated in place on registration and
+    deletion; the TTL bounds staleness for changes made by other processes.
+    """
+
+    def __init__(self, max_classes=None, ttl_seconds=None):
+        self.max_classes = max_classes or Config.GALLERY_CACHE_MAX_CLASSES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.GALLERY_CACHE_TTL_SECONDS
+
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}    # class_code -> [lock, threads holding or waiting for it]
+        self._versions = {}      # class_code -> changes seen while a load is in flight
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _is_fresh(self, entry):
+        return not self.ttl_seconds or (time.time() - entry.loaded_at) < self.ttl_seconds
+
+    def get(self, class_code):
+        """Return the cached entry for class_code, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(class_code)
+            if entry is not None and self._is_fresh(entry):
+                self._entries.move_to_end(class_code)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[class_code]
+            self.misses += 1
+            return None
+
+    def get_or_load(self, class_code, loader):
+        """
+        Return the entry for class_code, building it from loader() on a miss
+        loader may return a list of users or a ready GalleryEntry.
+        Only one thread loads a given class at a time; the rest wait for it.
+        """
+        entry = self.get(class_code)
+        if entry is not None:
+            return entry
+
+        load_lock = self._acquire_load_lock(class_code)
+        try:
+            with load_lock:
+                with self._lock:
+                    entry = self._entries.get(class_code)
+                    if entry is not None and self._is_fresh(entry):
+                        return entry
+                    version = self._versions.get(class_code, 0)
+
+                loaded = loader()
+                entry = loaded if isinstance(loaded, GalleryEntry) else GalleryEntry(class_code, loaded)
+
+                with self._lock:
+                    # Don't publish a gallery that was modified while loading
+                    if self._versions.get(class_code, 0) == version:
+                        self._store(class_code, entry)
+                return entry
+        finally:
+            self._release_load_lock(class_code)
+
+    def _acquire_load_lock(self, class_code):
+        with self._lock:
+            slot = self._load_locks.setdefault(class_code, [threading.Lock(), 0])
+            slot[1] += 1
+            return slot[0]
+
+    def _release_load_lock(self, class_code):
+        # The last thread out drops the lock, so only classes being loaded
+        # right now hold an entry
+        with self._lock:
+            slot = self._load_locks[class_code]
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._load_locks[class_code]
+                self._versions.pop(class_code, None)
+
+    def _store(self, class_code, entry):
+        self._entries[class_code] = entry
+        self._entries.move_to_end(class_code)
+        while len(self._entries) > self.max_classes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _affected_keys(self, class_code):
+        # The unfiltered (None) gallery contains every class
+        if class_code is None:
+            return list(self._entries.keys())
+        return [class_code, None]
+
+    def _bump(self, class_code):
+        # Versions only matter to loads in flight, so only those are tracked
+        if class_code is None:
+            keys = list(self._load_locks)
+        else:
+            keys = [key for key in (class_code, None) if key in self._load_locks]
+        for key in keys:
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def add_user(self, class_code, user, encodings):
+        """Add a newly registered user to any cached gallery it belongs to"""
+        with self._lock:
+            self._bump(class_code)
+            for key in self._affected_keys(class_code):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.add_user(user, encodings)
+
+    def remove_user(self, user_id, class_code=None):
+        """Remove a deleted user from cached galleries"""
+        with self._lock:
+            self._bump(class_code)
+            for key in self._affected_keys(class_code):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.remove_user(user_id, class_code)
+
+    def invalidate(self, class_code=None):
+        """Drop one class (or everything when class_code is None)"""
+        with self._lock:
+            self._bump(class_code)
+            if class_code is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                return
+            for key in self._affected_keys(class_code):
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        """Hit/miss/size counters for tuning"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'classes': len(self._entries),
+                'users': sum(len(e.users) for e in self._entries.values()),
+                'encodings': sum(len(e.matrix) for e in self._entries.values()),
+                'bytes': sum(e.nbytes for e in self._entries.values()),
+                'max_classes': self.max_classes,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+
+# Shared by every DatabaseManager instance in this process
+gallery_cache = GalleryCache()
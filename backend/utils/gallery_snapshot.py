@@ -0,0 +1,142 @@
+import json
+import os
+import glob
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+import numpy as np
+from config import Config
+
+
+class GallerySnapshot:
+    """A class gallery loaded from disk together with its generation"""
+
+    def __init__(self, class_code, generation, users, matrix, owners):
+        self.class_code = class_code
+        self.generation = generation
+        self.users = users
+        self.matrix = matrix
+        self.owners = owners
+
+
+class GallerySnapshotStore:
+    """
+    On-disk snapshots of per-class face galleries
+    One folder per class, named by the percent-escaped class code so codes
+    such as "A/1" and "B/1" never share a folder:
+        <SNAPSHOT_DIR>/<class_code>/encodings-<generation>.npy
+        <SNAPSHOT_DIR>/<class_code>/owners-<generation>.npy
+        <SNAPSHOT_DIR>/<class_code>/gallery.json   (sidecar: generation + users)
+    Arrays are opened with np.load(mmap_mode='r') so worker processes share
+    the page cache instead of each holding a private copy. The sidecar is
+    replaced atomically last, so readers never see a half-written snapshot.
+    """
+
+    SIDECAR = 'gallery.json'
+
+    def __init__(self, snapshot_dir=None):
+        self.snapshot_dir = snapshot_dir or Config.GALLERY_SNAPSHOT_DIR
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+    @staticmethod
+    def _dir_name(class_code):
+        # Escape '.' as well so "." and ".." cannot name a folder
+        return quote(str(class_code), safe='').replace('.', '%2E')
+
+    def _class_dir(self, class_code):
+        return os.path.join(self.snapshot_dir, self._dir_name(class_code))
+
+    def list_classes(self):
+        """Class codes that have a snapshot on disk"""
+        pattern = os.path.join(self.snapshot_dir, '*', self.SIDECAR)
+        return sorted(unquote(os.path.basename(os.path.dirname(p))) for p in glob.glob(pattern))
+
+    def load(self, class_code):
+        """Memory-map the snapshot for class_code, or None if there isn't a usable one"""
+        class_dir = self._class_dir(class_code)
+        try:
+            with open(os.path.join(class_dir, self.SIDECAR)) as f:
+                meta = json.load(f)
+
+            generation = meta['generation']
+            matrix = np.load(os.path.join(class_dir, meta['encodings_file']), mmap_mode='r')
+            owners = np.load(os.path.join(class_dir, meta['owners_file']), mmap_mode='r')
+            return GallerySnapshot(class_code, generation, meta['users'], matrix, owners)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable gallery snapshot for {class_code}: {e}")
+            return None
+
+    def save(self, entry, generation):
+        """Write a GalleryEntry to disk as generation"""
+        class_dir = self._class_dir(entry.class_code)
+        os.makedirs(class_dir, exist_ok=True)
+
+        try:
+            encodings_file = f'encodings-{generation}.npy'
+            owners_file = f'owners-{generation}.npy'
+            self._write_array(os.path.join(class_dir, encodings_file), entry.matrix)
+            self._write_array(os.path.join(class_dir, owners_file), entry.owners)
+
+            meta = {
+                'class_code': entry.class_code,
+                'generation': generation,
+                'encodings_file': encodings_file,
+                'owners_file': owners_file,
+                'users': [self._json_safe(u) for u in entry.users],
+                'saved_at': datetime.now().isoformat()
+            }
+            sidecar = os.path.join(class_dir, self.SIDECAR)
+            previous = self._sidecar_generation(sidecar)
+            tmp_path = f'{sidecar}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, sidecar)
+
+            self._remove_stale(class_dir, generation, previous)
+            print(f"✓ Gallery snapshot for {entry.class_code} saved (generation {generation})")
+            return True
+        except Exception as e:
+            print(f"❌ Error saving gallery snapshot for {entry.class_code}: {e}")
+            return False
+
+    @staticmethod
+    def _write_array(path, array):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _sidecar_generation(sidecar):
+        try:
+            with open(sidecar) as f:
+                return json.load(f)['generation']
+        except Exception:
+            return None
+
+    @staticmethod
+    def _remove_stale(class_dir, generation, previous=None):
+        # The generation the sidecar pointed at until now is kept: another
+        # process may have read it and be about to map its arrays. Newer
+        # files belong to a concurrent save and are left alone too.
+        keep = {generation, previous}
+        for name in os.listdir(class_dir):
+            stem, ext = os.path.splitext(name)
+            if ext != '.npy' or '-' not in stem:
+                continue
+            try:
+                file_generation = int(stem.rsplit('-', 1)[1])
+                if file_generation < generation and file_generation not in keep:
+                    os.remove(os.path.join(class_dir, name))
+            except (ValueError, OSError):
+                pass
+
+    @staticmethod
+    def _json_safe(user):
+        return {k: (v if isinstance(v, (str, int, float, bool, type(None))) else str(v))
+                for k, v in user.items()}
+
+
+snapshot_store = GallerySnapshotStore()
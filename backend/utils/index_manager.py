@@ -0,0 +1,385 @@
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from config import Config
+
+
+# Indexes every hot query relies on, by collection. Names are explicit so
+# the report can tell declared indexes from ad-hoc ones.
+REQUIRED_INDEXES = {
+    'users': [
+        # get_user_by_id, save_user duplicate check, delete_user
+        IndexModel([('user_id', ASCENDING), ('class_code', ASCENDING), ('is_active', ASCENDING)],
+                   name='users_user_class_active'),
+        # get_all_users / class statistics
+        IndexModel([('class_code', ASCENDING), ('is_active', ASCENDING)],
+                   name='users_class_active'),
+        # gallery snapshot replay
+        IndexModel([('class_code', ASCENDING), ('gallery_generation', ASCENDING)],
+                   name='users_class_generation'),
+    ],
+    'face_encodings': [
+        # per-user and per-class encoding loads, sorted by encoding_index
+        IndexModel([('user_id', ASCENDING), ('class_code', ASCENDING), ('encoding_index', ASCENDING)],
+                   name='face_encodings_user_class_index'),
+        # bulk class loads and per-user counts
+        IndexModel([('class_code', ASCENDING), ('user_id', ASCENDING), ('encoding_index', ASCENDING)],
+                   name='face_encodings_class_user_index'),
+    ],
+    'attendance': [
+        # One record per student, class and day; mark_attendance upserts on it
+        IndexModel([('user_id', ASCENDING), ('class_code', ASCENDING), ('date', ASCENDING)],
+                   name='attendance_user_class_date_unique', unique=True),
+        # get_attendance_by_date, sorted by time
+        IndexModel([('class_code', ASCENDING), ('date', ASCENDING), ('time', ASCENDING)],
+                   name='attendance_class_date_time'),
+        IndexModel([('date', ASCENDING), ('time', ASCENDING)],
+                   name='attendance_date_time'),
+        # iter_attendance export order: newest day first, by time within it
+        IndexModel([('class_code', ASCENDING), ('date', DESCENDING), ('time', ASCENDING)],
+                   name='attendance_class_date_desc_time'),
+        IndexModel([('date', DESCENDING), ('time', ASCENDING)],
+                   name='attendance_date_desc_time'),
+        # get_all_attendance, newest first
+        IndexModel([('class_code', ASCENDING), ('timestamp', DESCENDING)],
+                   name='attendance_class_timestamp'),
+        IndexModel([('timestamp', DESCENDING)],
+                   name='attendance_timestamp'),
+    ],
+    'attendance_daily': [
+        # One rollup per class and day, maintained by mark_attendance
+        IndexModel([('class_code', ASCENDING), ('date', ASCENDING)],
+                   name='attendance_daily_class_date_unique', unique=True),
+        IndexModel([('date', ASCENDING)], name='attendance_daily_date'),
+    ],
+    'gallery_meta': [
+        IndexModel([('class_code', ASCENDING)], name='gallery_meta_class', unique=True),
+    ],
+}
+
+
+def _baseline_indexes(db):
+    """Indexes as first declared; frozen so re-running it never changes"""
+    db.users.create_indexes([
+        IndexModel([('user_id', ASCENDING), ('class_code', ASCENDING), ('is_active', ASCENDING)],
+                   name='users_user_class_active'),
+        IndexModel([('class_code', ASCENDING), ('is_active', ASCENDING)],
+                   name='users_class_active'),
+        IndexModel([('class_code', ASCENDING), ('gallery_generation', ASCENDING)],
+                   name='users_class_generation'),
+    ])
+    db.face_encodings.create_indexes([
+        IndexModel([('user_id', ASCENDING), ('class_code', ASCENDING), ('encoding_index', ASCENDING)],
+                   name='face_encodings_user_class_index'),
+    ])
+    db.attendance.create_indexes([
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING), ('class_code', ASCENDING)],
+                   name='attendance_user_date_class'),
+        IndexModel([('class_code', ASCENDING), ('date', ASCENDING), ('time', ASCENDING)],
+                   name='attendance_class_date_time'),
+        IndexModel([('date', ASCENDING), ('time', ASCENDING)],
+                   name='attendance_date_time'),
+        IndexModel([('class_code', ASCENDING), ('timestamp', DESCENDING)],
+                   name='attendance_class_timestamp'),
+        IndexModel([('timestamp', DESCENDING)],
+                   name='attendance_timestamp'),
+    ])
+    db.gallery_meta.create_indexes([
+        IndexModel([('class_code', ASCENDING)], name='gallery_meta_class', unique=True),
+    ])
+
+
+def find_duplicate_attendance(db):
+    """
+    Groups of attendance records sharing (user_id, class_code, date),
+    each with its record ids oldest first
+    """
+    return list(db.attendance.aggregate([
+        {'$sort': {'timestamp': 1}},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'class_code': '$class_code', 'date': '$date'},
+            'ids': {'$push': '$_id'},
+            'count': {'$sum': 1}
+        }},
+        {'$match': {'count': {'$gt': 1}}}
+    ], allowDiskUse=True))
+
+
+def remove_duplicate_attendance(db, apply=False):
+    """
+    Keep the earliest record of each duplicated (user_id, class_code, date)
+    Reports what would be removed unless apply is set. Removed records are
+    first copied to attendance_duplicates_backup. Returns the number of
+    extra records found (and removed, when applying).
+    """
+    groups = find_duplicate_attendance(db)
+    extra = [record_id for group in groups for record_id in group['ids'][1:]]
+
+    for group in groups[:20]:
+        key = group['_id']
+        print(f"  {key.get('user_id')} {key.get('class_code')} {key.get('date')}: "
+              f"{group['count']} records, keeping the earliest")
+    if len(groups) > 20:
+        print(f"  ... and {len(groups) - 20} more")
+
+    if not apply or not extra:
+        return len(extra)
+
+    removed_at = datetime.now()
+    for start in range(0, len(extra), 1000):
+        chunk = extra[start:start + 1000]
+        records = list(db.attendance.find({'_id': {'$in': chunk}}))
+        if records:
+            db.attendance_duplicates_backup.insert_many(
+                [{**record, 'removed_at': removed_at} for record in records], ordered=False)
+        db.attendance.delete_many({'_id': {'$in': chunk}})
+    print(f"✓ Removed {len(extra)} duplicate attendance records (backed up to attendance_duplicates_backup)")
+    return len(extra)
+
+
+def _unique_daily_attendance(db):
+    """
+    Replace the plain (user_id, date, class_code) index with a unique one
+    Never deletes data: with duplicates present the migration fails and
+    stays pending until they are removed with
+    `python manage_indexes.py dedupe-attendance --apply`.
+    """
+    try:
+        db.attendance.create_index(
+            [('user_id', ASCENDING), ('class_code', ASCENDING), ('date', ASCENDING)],
+            name='attendance_user_class_date_unique',
+            unique=True
+        )
+    except OperationFailure as e:
+        if e.code != 11000:
+            raise
+        raise RuntimeError(
+            "duplicate attendance records block the unique index; review them with "
+            "`python manage_indexes.py dedupe-attendance` and remove them with --apply"
+        ) from e
+
+    if 'attendance_user_date_class' in db.attendance.index_information():
+        db.attendance.drop_index('attendance_user_date_class')
+
+
+def daily_rollup_group():
+    """$group stage counting present and late marks per class and day"""
+    return {'$group': {
+        '_id': {'class_code': '$class_code', 'date': '$date'},
+        'present': {'$sum': 1},
+        'late': {'$sum': {'$cond': [{'$gte': ['$time', Config.LATE_ARRIVAL_TIME]}, 1, 0]}}
+    }}
+
+
+def rebuild_daily_rollup(db, date=None):
+    """
+    Recount attendance_daily from the attendance records, for one date or
+    all of them. Marks made while it runs may be counted twice or missed,
+    so run it when the affected day is quiet.
+    Returns the number of rollup documents written.
+    """
+    match = {'date': date} if date else {}
+    if date:
+        # Classes whose records for the day are gone drop back to zero
+        db.attendance_daily.update_many(match, {'$set': {'present': 0, 'late': 0}})
+
+    written = 0
+    operations = []
+    for group in db.attendance.aggregate([{'$match': match}, daily_rollup_group()], allowDiskUse=True):
+        key = {'class_code': group['_id'].get('class_code'), 'date': group['_id'].get('date')}
+        operations.append(ReplaceOne(key, {**key, 'present': group['present'], 'late': group['late']},
+                                     upsert=True))
+        if len(operations) >= 1000:
+            db.attendance_daily.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        db.attendance_daily.bulk_write(operations, ordered=False)
+        written += len(operations)
+    return written
+
+
+def _attendance_daily_rollup(db):
+    """
+    Build attendance_daily from the existing attendance records
+    Safe while marks keep arriving: new marks are written with
+    counted_in_rollup and \$inc the rollup themselves, so the backfill only
+    counts older records, claiming each batch by setting the flag before
+    adding it. Records are walked in _id order, a batch at a time.
+    """
+    db.attendance_daily.create_index(
+        [('class_code', ASCENDING), ('date', ASCENDING)],
+        name='attendance_daily_class_date_unique',
+        unique=True
+    )
+
+    last_id = None
+    while True:
+        query = {'counted_in_rollup': {'$ne': True}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        records = list(db.attendance.find(query, {'class_code': 1, 'date': 1, 'time': 1})
+                       .sort('_id', ASCENDING).limit(1000))
+        if not records:
+            break
+        last_id = records[-1]['_id']
+
+        db.attendance.update_many(
+            {'_id': {'$in': [r['_id'] for r in records]}, 'counted_in_rollup': {'$ne': True}},
+            {'$set': {'counted_in_rollup': True}}
+        )
+
+        counts = {}
+        for record in records:
+            key = (record.get('class_code'), record.get('date'))
+            present, late = counts.get(key, (0, 0))
+            counts[key] = (present + 1, late + int(record.get('time', '') >= Config.LATE_ARRIVAL_TIME))
+        for (class_code, date), (present, late) in counts.items():
+            db.attendance_daily.update_one({'class_code': class_code, 'date': date},
+                                           {'$inc': {'present': present, 'late': late}}, upsert=True)
+
+
+# get_daily_stats reads the rollup only once this has been applied
+DAILY_ROLLUP_MIGRATION = 3
+
+
+# Versioned schema changes, applied once each in order and recorded in
+# schema_migrations. Append new entries; never renumber or edit applied
+# ones, and spell out their indexes rather than reading REQUIRED_INDEXES.
+MIGRATIONS = [
+    (1, 'baseline_indexes', _baseline_indexes),
+    (2, 'unique_daily_attendance', _unique_daily_attendance),
+    (3, 'attendance_daily_rollup', _attendance_daily_rollup),
+]
+
+
+class IndexManager:
+    """
+    Declares, migrates and reports on the database's indexes
+    Migrations run once per database; a version is claimed by inserting
+    its schema_migrations document first, so concurrent workers starting
+    together do not apply it twice. ensure_indexes() is idempotent and
+    recreates any declared index that has gone missing.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.migrations = db['schema_migrations']
+
+    def applied_versions(self):
+        return {doc['_id'] for doc in self.migrations.find({'status': 'applied'}, {'_id': 1})}
+
+    def run_migrations(self):
+        """Apply pending migrations in version order, returns versions applied"""
+        applied = []
+        done = self.applied_versions()
+
+        for version, name, migrate in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in done:
+                continue
+
+            try:
+                self.migrations.insert_one({
+                    '_id': version,
+                    'name': name,
+                    'status': 'running',
+                    'started_at': datetime.now()
+                })
+            except DuplicateKeyError:
+                # Retry failed migrations and ones whose runner died mid-way
+                stale = datetime.now() - timedelta(seconds=Config.DB_MIGRATION_LOCK_SECONDS)
+                reclaimed = self.migrations.find_one_and_update(
+                    {'_id': version, '$or': [{'status': 'failed'}, {'started_at': {'$lt': stale}}]},
+                    {'$set': {'status': 'running', 'started_at': datetime.now()}}
+                )
+                if reclaimed is None:
+                    print(f"ℹ️ Migration {version} ({name}) is being applied elsewhere, stopping here")
+                    break
+
+            try:
+                migrate(self.db)
+            except Exception as e:
+                self.migrations.update_one({'_id': version},
+                                           {'$set': {'status': 'failed', 'error': str(e)}})
+                print(f"❌ Migration {version} ({name}) failed: {e}")
+                break
+
+            self.migrations.update_one({'_id': version},
+                                       {'$set': {'status': 'applied', 'applied_at': datetime.now()}})
+            applied.append(version)
+            print(f"✓ Applied migration {version} ({name})")
+
+        return applied
+
+    def ensure_indexes(self):
+        """Create any declared index that does not exist yet"""
+        for collection, indexes in REQUIRED_INDEXES.items():
+            existing = set(self.db[collection].index_information())
+            for index in indexes:
+                name = index.document['name']
+                if name in existing:
+                    continue
+                # One at a time, so a unique index blocked by existing data
+                # does not hold back the others
+                try:
+                    self.db[collection].create_indexes([index])
+                    print(f"✓ Created index {name} on {collection}")
+                except OperationFailure as e:
+                    print(f"⚠️ Could not create index {name} on {collection}: {e}")
+
+    def report(self):
+        """
+        Missing, undeclared and unused indexes per collection
+        Usage counts come from $indexStats and reset when the server
+        restarts, so 'unused' means unused since then.
+        """
+        report = {}
+        for collection, indexes in REQUIRED_INDEXES.items():
+            declared = {index.document['name'] for index in indexes}
+            existing = set(self.db[collection].index_information()) - {'_id_'}
+
+            try:
+                stats = list(self.db[collection].aggregate([{'$indexStats': {}}]))
+                unused = sorted(s['name'] for s in stats
+                                if s['name'] != '_id_' and s['accesses']['ops'] == 0)
+            except OperationFailure:
+                unused = None  # $indexStats needs clusterMonitor privileges
+
+            report[collection] = {
+                'missing': sorted(declared - existing),
+                'undeclared': sorted(existing - declared),
+                'unused': unused
+            }
+        return report
+
+    def bootstrap(self):
+        """Run migrations, ensure indexes and print anything worth a look"""
+        self.run_migrations()
+        self.ensure_indexes()
+
+        for collection, entry in self.report().items():
+            if entry['missing']:
+                print(f"⚠️ {collection}: missing indexes {', '.join(entry['missing'])}")
+            if entry['undeclared']:
+                print(f"ℹ️ {collection}: undeclared indexes {', '.join(entry['undeclared'])}")
+            if entry['unused']:
+                print(f"ℹ️ {collection}: indexes unused since server start {', '.join(entry['unused'])}")
+
+
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+
+def bootstrap_indexes(db):
+    """Bootstrap a database's schema once per process"""
+    with _bootstrap_lock:
+        if db.name in _bootstrapped:
+            return
+        _bootstrapped.add(db.name)
+
+    try:
+        IndexManager(db).bootstrap()
+    except Exception as e:
+        print(f"⚠️ Index bootstrap failed: {e}")
@@ -1,24 +1,22 @@
 import cv2
 import numpy as np
+from utils.cascades import (
+    detect_multiscale, scaled_min_size, FACE_CASCADE, EYE_CASCADE, FACE_MIN_SIZE, EYE_MIN_SIZE
+)
 
 
 class LivenessDetector:
     """
     Liveness detector using eye detection
     Photos don't have working eyes, real faces do
+    Stateless: share liveness_detector rather than constructing new ones;
+    cascades come from the process-wide pool in utils.cascades.
     """
     
-    def __init__(self):
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        self.eye_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_eye.xml'
-        )
-    
-    def detect_liveness(self, image):
+    def detect_liveness(self, image, scale=1.0):
         """
         Simple eye-based liveness detection
+        scale: fraction of full resolution the image was decoded at
         Returns: (is_live, confidence, reason)
         """
         if image is None or image.size == 0:
@@ -28,7 +26,7 @@ class LivenessDetector:
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             
             # Detect face
-            faces = self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(50, 50))
+            faces = detect_multiscale(FACE_CASCADE, gray, 1.1, 5, minSize=scaled_min_size(FACE_MIN_SIZE, scale))
             
             if len(faces) == 0:
                 print("❌ No face detected")
@@ -39,7 +37,7 @@ class LivenessDetector:
             face_roi = gray[y:y+h, x:x+w]
             
             # Detect eyes in face region
-            eyes = self.eye_cascade.detectMultiScale(face_roi, 1.1, 5, minSize=(20, 20))
+            eyes = detect_multiscale(EYE_CASCADE, face_roi, 1.1, 5, minSize=scaled_min_size(EYE_MIN_SIZE, scale))
             
             # Check various factors
             has_eyes = len(eyes) >= 2
@@ -66,3 +64,6 @@ class LivenessDetector:
             print(f"❌ Liveness check error: {e}")
             # If check fails, allow it (avoid false negatives)
             return True, 50, f"Check bypassed due to error: {str(e)}"
+
+
+liveness_detector = LivenessDetector()
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+
+import cv2
+from config import Config
+from utils.face_utils import FaceUtils
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_model_file(path, expected_sha256):
+    """
+    Check a model file exists and matches its configured checksum
+    Returns True when the file can be used. A missing checksum only warns,
+    so locally supplied weights still load.
+    """
+    if not os.path.exists(path):
+        print(f"❌ Model file not found: {path}")
+        return False
+
+    if not expected_sha256:
+        print(f"⚠️ No checksum configured for {os.path.basename(path)}, skipping verification")
+        return True
+
+    actual = file_sha256(path)
+    if actual.lower() != expected_sha256.lower():
+        print(f"❌ Checksum mismatch for {path}: expected {expected_sha256}, got {actual}")
+        return False
+    return True
+
+
+class ModelRegistry:
+    """
+    Process-wide home for loaded models
+    Every route shares one FaceUtils (and therefore one detector pool), so
+    the SSD model is read from disk once per process. Weights come only
+    from the bundled models directory or the paths in Config; nothing is
+    downloaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._face_utils = None
+        self.warmed_up = False
+
+    def get_face_utils(self):
+        """Shared FaceUtils, loaded on first use"""
+        if self._face_utils is None:
+            with self._lock:
+                if self._face_utils is None:
+                    self._face_utils = self._load_face_utils()
+        return self._face_utils
+
+    def _load_face_utils(self):
+        prototxt_path = Config.FACE_DETECTOR_PROTOTXT
+        caffemodel_path = Config.FACE_DETECTOR_WEIGHTS
+
+        verified = (
+            verify_model_file(prototxt_path, Config.FACE_DETECTOR_PROTOTXT_SHA256) and
+            verify_model_file(caffemodel_path, Config.FACE_DETECTOR_WEIGHTS_SHA256)
+        )
+        if not verified:
+            message = ("DNN face detector unavailable; run `python fetch_models.py` "
+                       "from the backend directory to install the verified weights")
+            if Config.FACE_DETECTOR_REQUIRED:
+                raise RuntimeError(message)
+            # Unverified weights are never loaded; use the Haar Cascade fallback
+            print(f"❌ {message}. Falling back to Haar Cascade detection")
+            return FaceUtils(use_dnn=False)
+
+        return FaceUtils(prototxt_path, caffemodel_path)
+
+    def warm_up(self, detectors=None):
+        """Load models and push a dummy frame through them"""
+        face_utils = self.get_face_utils()
+        count = detectors or Config.MODEL_WARMUP_DETECTORS
+        face_utils.warm_up(count)
+        self.warmed_up = True
+        print(f"✓ Models warmed up ({count} detector{'s' if count != 1 else ''})")
+
+    def stats(self):
+        return {
+            'face_detector_loaded': self._face_utils is not None,
+            'face_detector': (None if self._face_utils is None
+                              else 'dnn' if isinstance(self._face_utils.face_net, cv2.dnn_Net) else 'haar'),
+            'warmed_up': self.warmed_up,
+            'detector_pool': self._face_utils.detector_pool.stats() if self._face_utils else None
+        }
+
+
+model_registry = ModelRegistry()
+
+
+def get_face_utils():
+    """Shared FaceUtils for all routes"""
+    return model_registry.get_face_utils()
@@ -0,0 +1,222 @@
+"""
+Mark attendance from a recorded lecture video
+
+Usage (from the backend directory):
+    python video_attendance.py lecture.mp4 --class-code CS101
+    python video_attendance.py lecture.mp4 --class-code CS101 --sample-fps 2 --workers 4
+    python video_attendance.py lecture.mp4 --class-code CS101 --recorded-at "2024-03-04 09:00" --dry-run
+
+Frames are sampled at --sample-fps and spread across a process pool, where
+every face is detected and encoded with FaceUtils. Faces are matched
+against the class gallery frame by frame; a student counts as present once
+they have been recognized in --min-sightings sampled frames, and all marks
+are written with one bulk operation.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+import numpy as np
+from config import Config
+from utils.db_manager import DatabaseManager
+from utils.face_matcher import FaceMatcher
+from utils.model_registry import get_face_utils
+
+_face_utils = None
+
+
+def _init_worker():
+    """Load the face detector once per worker process"""
+    global _face_utils
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    _face_utils = get_face_utils()
+
+
+def _process_batch(batch):
+    """
+    Detect and encode every face in a batch of sampled frames
+    batch: list of (frame_index, timestamp, frame)
+    Returns: list of (frame_index, timestamp, encodings)
+    """
+    frames = [frame for _, _, frame in batch]
+    encodings = [[] for _ in batch]
+    for face in _face_utils.analyze_group(frames):
+        encodings[face.image_index].append(np.asarray(face.encoding, dtype=np.float32))
+    return [(index, ts, encs) for (index, ts, _), encs in zip(batch, encodings)]
+
+
+def sample_frames(video_path, sample_fps, batch_size):
+    """
+    Yield batches of (frame_index, timestamp, frame) sampled at sample_fps
+    Skipped frames are only grabbed, not decoded.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise IOError(f"Could not open video {video_path}")
+
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    step = max(1, int(round(video_fps / sample_fps)))
+
+    batch = []
+    frame_index = 0
+    try:
+        while capture.grab():
+            if frame_index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    batch.append((frame_index, frame_index / video_fps, frame))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+            frame_index += 1
+        if batch:
+            yield batch
+    finally:
+        capture.release()
+
+
+class SightingTracker:
+    """
+    Deduplicates identities over the length of a video
+    Keeps how often, when first and how confidently each student was seen.
+    """
+
+    def __init__(self, gallery, tolerance=None):
+        self.gallery = gallery
+        self.matcher = FaceMatcher(tolerance)
+        self.sightings = {}
+
+    def add_frame(self, timestamp, encodings):
+        if not encodings:
+            return
+        for match in self.matcher.match_many(self.gallery, encodings):
+            if not match.matched:
+                continue
+            user_id = match.user['user_id']
+            seen = self.sightings.get(user_id)
+            if seen is None:
+                self.sightings[user_id] = {
+                    'user': match.user,
+                    'count': 1,
+                    'first_seen': timestamp,
+                    'best_similarity': match.similarity
+                }
+            else:
+                seen['count'] += 1
+                seen['best_similarity'] = max(seen['best_similarity'], match.similarity)
+
+    def present(self, min_sightings):
+        return [s for s in self.sightings.values() if s['count'] >= min_sightings]
+
+
+def run(video_path, class_code, sample_fps=None, workers=None, batch_size=None,
+        min_sightings=None, tolerance=None, recorded_at=None, dry_run=False):
+    sample_fps = sample_fps or Config.VIDEO_SAMPLE_FPS
+    workers = workers or os.cpu_count() or 1
+    batch_size = batch_size or Config.VIDEO_BATCH_SIZE
+    min_sightings = min_sightings or Config.VIDEO_MIN_SIGHTINGS
+
+    db_manager = DatabaseManager()
+    gallery = db_manager.get_class_gallery(class_code)
+    if not gallery.users:
+        print(f"❌ No registered users found in class {class_code}")
+        return []
+
+    print(f"🎬 Processing {video_path} for class {class_code} "
+          f"({len(gallery.users)} registered, {sample_fps} fps sampled, {workers} workers)")
+
+    tracker = SightingTracker(gallery, tolerance)
+    frames_done = 0
+    faces_seen = 0
+    last_timestamp = 0.0
+    started = time.perf_counter()
+
+    # Spawned workers avoid forking the MongoDB client and OpenCV's threads
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker) as pool:
+        pending = deque()
+
+        def drain(limit):
+            nonlocal frames_done, faces_seen, last_timestamp
+            while len(pending) > limit:
+                for _, timestamp, encodings in pending.popleft().result():
+                    tracker.add_frame(timestamp, encodings)
+                    frames_done += 1
+                    faces_seen += len(encodings)
+                    last_timestamp = max(last_timestamp, timestamp)
+
+        for batch in sample_frames(video_path, sample_fps, batch_size):
+            pending.append(pool.submit(_process_batch, batch))
+            # Bound the number of decoded frames held in memory
+            drain(workers * 2)
+        drain(0)
+
+    elapsed = time.perf_counter() - started
+    present = tracker.present(min_sightings)
+
+    print(f"✓ {frames_done} frames, {faces_seen} faces in {elapsed:.1f}s "
+          f"({frames_done / elapsed if elapsed else 0:.1f} frames/s, "
+          f"{last_timestamp / elapsed if elapsed else 0:.1f}x realtime)")
+    print(f"✓ {len(tracker.sightings)} students recognized, "
+          f"{len(present)} seen in at least {min_sightings} frames")
+
+    for seen in sorted(present, key=lambda s: s['first_seen']):
+        user = seen['user']
+        print(f"  {user['user_id']} {user.get('name', '')}: {seen['count']} sightings, "
+              f"first at {seen['first_seen']:.0f}s, best {seen['best_similarity']:.3f}")
+
+    if dry_run or not present:
+        return present
+
+    marks = db_manager.mark_attendance_bulk(
+        [(s['user']['user_id'], s['user']['name']) for s in present],
+        class_code=class_code,
+        marked_at=recorded_at
+    )
+    marked = sum(1 for m in marks.values() if m['status'] == 'success')
+    already = sum(1 for m in marks.values() if m['status'] == 'already_marked')
+    errors = {user_id: m for user_id, m in marks.items() if m['status'] == 'error'}
+    print(f"✅ Marked {marked} students, {already} already marked")
+    if errors:
+        print(f"❌ Could not mark {len(errors)} students:")
+        for user_id, m in errors.items():
+            print(f"  {user_id}: {m.get('message', 'unknown error')}")
+    return present
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mark attendance from a recorded lecture video')
+    parser.add_argument('video', help='path to a local video file')
+    parser.add_argument('--class-code', required=True)
+    parser.add_argument('--sample-fps', type=float, default=Config.VIDEO_SAMPLE_FPS,
+                        help='frames per second of video to analyze')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=Config.VIDEO_BATCH_SIZE,
+                        help='sampled frames sent to a worker at a time')
+    parser.add_argument('--min-sightings', type=int, default=Config.VIDEO_MIN_SIGHTINGS,
+                        help='sampled frames a student must be recognized in')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='override FACE_RECOGNITION_TOLERANCE')
+    parser.add_argument('--recorded-at', default=None,
+                        help='"YYYY-MM-DD HH:MM" the lecture was recorded (defaults to now)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report who was seen without marking attendance')
+    args = parser.parse_args()
+
+    recorded_at = datetime.strptime(args.recorded_at, '%Y-%m-%d %H:%M') if args.recorded_at else None
+
+    run(args.video, args.class_code,
+        sample_fps=args.sample_fps,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        min_sightings=args.min_sightings,
+        tolerance=args.tolerance,
+        recorded_at=recorded_at,
+        dry_run=args.dry_run)
@@ -1,6 +1,11 @@
 import React, { useState, useRef, useEffect } from 'react';
 import Webcam from 'react-webcam';
-import { markAttendance } from '../services/api';
+import {
+  markAttendance,
+  createCaptureSession,
+  sendCaptureFrames,
+  closeCaptureSession
+} from '../services/api';
 import './MarkAttendance.css';
 
 const MarkAttendance = () => {
@@ -14,6 +19,9 @@ const MarkAttendance = () => {
   const webcamRef = useRef(null);
   const detectionIntervalRef = useRef(null);
   const framesRef = useRef([]);
+  const sessionRef = useRef(null);
+  const uploadRef = useRef(Promise.resolve());
+  const finishedRef = useRef(false);
 
   useEffect(() => {
     return () => {
@@ -35,10 +43,19 @@ const MarkAttendance = () => {
     setMessageType('info');
     setBlinkStatus('Detecting...');
     framesRef.current = [];
+    sessionRef.current = null;
+    uploadRef.current = Promise.resolve();
+    finishedRef.current = false;
     
     let frameCount = 0;
     const maxFrames = 15;  // Capture 15 frames (about 3 seconds at 5fps)
     
+    // Open a streaming session during the countdown so frames can be
+    // uploaded as they are captured; without one, fall back to one upload
+    createCaptureSession(maxFrames)
+      .then(data => { sessionRef.current = data.session_id; })
+      .catch(() => { sessionRef.current = null; });
+    
     setCountdown(3);
     const countdownTimer = setInterval(() => {
       setCountdown(prev => {
@@ -55,28 +72,60 @@ const MarkAttendance = () => {
   const startCapturing = () => {
     let frameCount = 0;
     const maxFrames = 15;
+    const sessionId = sessionRef.current;
     
     detectionIntervalRef.current = setInterval(() => {
-      if (!webcamRef.current) {
+      if (!webcamRef.current || finishedRef.current) {
         stopDetection();
         return;
       }
 
       const imageSrc = webcamRef.current.getScreenshot();
       if (imageSrc) {
-        framesRef.current.push(imageSrc);
+        if (sessionId) {
+          streamFrame(sessionId, imageSrc);
+        } else {
+          framesRef.current.push(imageSrc);
+        }
         frameCount++;
         
         setBlinkStatus(`Capturing... ${frameCount}/${maxFrames}`);
         
         if (frameCount >= maxFrames) {
           stopDetection();
-          processBlinkDetection();
+          if (sessionId) {
+            setBlinkStatus('Analyzing blink...');
+          } else {
+            processBlinkDetection();
+          }
         }
       }
     }, 200); // Capture every 200ms
   };
 
+  // Upload frames one after another so the server sees them in order;
+  // stop capturing as soon as the server has a final answer
+  const streamFrame = (sessionId, imageSrc) => {
+    uploadRef.current = uploadRef.current
+      .then(async () => {
+        if (finishedRef.current) return;
+        
+        const response = await sendCaptureFrames(sessionId, [imageSrc]);
+        if (response.status === 'pending' || finishedRef.current) return;
+        if (sessionRef.current !== sessionId) return;  // Capture was restarted
+        
+        finishedRef.current = true;
+        stopDetection();
+        handleResult(response);
+      })
+      .catch(error => {
+        if (finishedRef.current || sessionRef.current !== sessionId) return;
+        finishedRef.current = true;
+        stopDetection();
+        handleError(error);
+      });
+  };
+
   const stopDetection = () => {
     if (detectionIntervalRef.current) {
       clearInterval(detectionIntervalRef.current);
@@ -96,45 +145,57 @@ const MarkAttendance = () => {
         images: framesRef.current,
         mode: 'blink_detection'
       });
+      handleResult(response);
+    } catch (error) {
+      handleError(error);
+    }
+  };
 
-      if (response.status === 'success') {
-        setMessage(`✅ ${response.message}`);
-        setMessageType('success');
-        setBlinkStatus('Blink Confirmed!');
-        
-        // Show success for 3 seconds
-        setTimeout(() => {
-          setMessage('');
-          setBlinkStatus('Ready for next person');
-          framesRef.current = [];
-        }, 3000);
-      } else if (response.status === 'liveness_failed') {
-        setMessage(`⚠️ ${response.message}`);
-        setMessageType('error');
-        setBlinkStatus('No blink detected');
-        framesRef.current = [];
-      } else if (response.status === 'already_marked') {
-        setMessage(`ℹ️ ${response.message}`);
-        setMessageType('warning');
-        setBlinkStatus('Already marked');
-        framesRef.current = [];
-      } else {
-        setMessage(`❌ ${response.message || 'Failed to mark attendance'}`);
-        setMessageType('error');
-        setBlinkStatus('Failed');
+  const handleResult = (response) => {
+    if (response.status === 'success') {
+      setMessage(`✅ ${response.message}`);
+      setMessageType('success');
+      setBlinkStatus('Blink Confirmed!');
+      
+      // Show success for 3 seconds
+      setTimeout(() => {
+        setMessage('');
+        setBlinkStatus('Ready for next person');
         framesRef.current = [];
-      }
-    } catch (error) {
-      const errorMsg = error.response?.data?.message || error.message || 'Failed to process';
-      setMessage(`❌ Error: ${errorMsg}`);
+      }, 3000);
+    } else if (response.status === 'liveness_failed') {
+      setMessage(`⚠️ ${response.message}`);
+      setMessageType('error');
+      setBlinkStatus('No blink detected');
+      framesRef.current = [];
+    } else if (response.status === 'already_marked') {
+      setMessage(`ℹ️ ${response.message}`);
+      setMessageType('warning');
+      setBlinkStatus('Already marked');
+      framesRef.current = [];
+    } else {
+      setMessage(`❌ ${response.message || 'Failed to mark attendance'}`);
       setMessageType('error');
-      setBlinkStatus('Error occurred');
+      setBlinkStatus('Failed');
       framesRef.current = [];
     }
   };
 
+  const handleError = (error) => {
+    const errorMsg = error.response?.data?.message || error.message || 'Failed to process';
+    setMessage(`❌ Error: ${errorMsg}`);
+    setMessageType('error');
+    setBlinkStatus('Error occurred');
+    framesRef.current = [];
+  };
+
   const resetDetection = () => {
     stopDetection();
+    if (sessionRef.current && !finishedRef.current) {
+      closeCaptureSession(sessionRef.current).catch(() => {});
+    }
+    finishedRef.current = true;
+    sessionRef.current = null;
     framesRef.current = [];
     setMessage('');
     setMessageType('');
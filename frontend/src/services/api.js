@@ -46,6 +46,49 @@ export const markAttendance = async (imageData) => {
   return response.data;
 };
 
+// Open a streaming capture session for blink-verified attendance
+export const createCaptureSession = async (expectedFrames) => {
+  const response = await axios.post(
+    `${API_URL}/api/attendance/sessions`,
+    { expected_frames: expectedFrames },
+    { headers: getAuthHeaders() }
+  );
+  return response.data;
+};
+
+// Convert a webcam data URL into a binary JPEG blob
+const dataUrlToBlob = async (dataUrl) => {
+  const response = await fetch(dataUrl);
+  return response.blob();
+};
+
+// Send captured frames to a session; resolves with 'pending' until decided
+// Frames go up as raw JPEG parts, avoiding base64 and JSON overhead
+export const sendCaptureFrames = async (sessionId, frames) => {
+  const formData = new FormData();
+  const blobs = await Promise.all(frames.map(dataUrlToBlob));
+  blobs.forEach((blob, idx) => formData.append('images', blob, `frame-${idx}.jpg`));
+  
+  const response = await axios.post(
+    `${API_URL}/api/attendance/sessions/${sessionId}/frames`,
+    formData,
+    {
+      headers: getAuthHeaders(),
+      validateStatus: (status) => status < 500  // Final results may be 4xx
+    }
+  );
+  return response.data;
+};
+
+// Abandon a capture session
+export const closeCaptureSession = async (sessionId) => {
+  const response = await axios.delete(
+    `${API_URL}/api/attendance/sessions/${sessionId}`,
+    { headers: getAuthHeaders() }
+  );
+  return response.data;
+};
+
 // Get attendance records
 export const getAttendance = async (date) => {
   const url = date 